@@ -1,160 +1,459 @@
 # app.py
 import gradio as gr
-import time
 import os
 import io
+import threading
+import uuid
 from dotenv import load_dotenv
 from datetime import datetime
-import pandas as pd # Import pandas here for use in app.py for live logs display
 
-# Import managers from other modules
-from firebase_handler import db # Firestore client
+# Load environment variables (for local development) before the handler modules read their settings
+load_dotenv()
+
+# Import managers from other modules. Firebase is initialized on first use (see firebase_handler.py).
+import firebase_handler
 from auth_handler import auth_manager # Auth logic
 from email_sender import email_manager # Email sending logic
-from excel_handler import excel_manager # Excel processing logic
+from excel_handler import excel_manager, ResultsWriter, save_source # Excel processing and results logic
+from template_engine import template_manager # Compiled subject/body personalization
+from send_scheduler import SendScheduler, RetryPolicy # Concurrent, rate-limited sending with deferred retries
+from log_writer import FirestoreLogWriter # Batched, background emailLogs writes
+from job_journal import job_journal, DEFERRED # Local per-recipient job state, for resuming campaigns
+from live_log import LiveLog, LIVE_REFRESH_INTERVAL # Bounded live log and counters for the dashboard
+from job_manager import job_manager, SendJob, QUEUED # Per-session jobs on a shared, fair worker pool
+from sender_pool import sender_pool # Sender accounts, their pacing and daily quotas
+from suppression import suppression_list # Per-user hard bounces and unsubscribes
+from campaign_history import campaign_history, parse_date_range # Paged emailLogs history and cached campaign totals
+from metrics import registry, send_loop_seconds, send_retries_total, JobProfiler, start_metrics_server # Hot-path timings and counters
 
-# Load environment variables (for local development)
-load_dotenv()
 GMAIL_APP_PASSWORD = os.getenv("GMAIL_APP_PASSWORD")
 
-# Global variables for application state
-current_send_job = {"running": False, "interrupt": False}
-email_logs = [] # To store logs for the current session/send operation
-global_user_id = None # Stores the authenticated user's UID
-global_user_email = None # Stores the authenticated user's email
-global_initial_df = None # Stores the initial DataFrame for final Excel generation
+# Worker count, rate and burst come from SEND_WORKERS / SEND_RATE_PER_SECOND / SEND_BURST
+send_scheduler = SendScheduler()
+# Backoff for transient SMTP failures, from SEND_MAX_ATTEMPTS / SEND_RETRY_BASE_DELAY / SEND_RETRY_MAX_DELAY
+retry_policy = RetryPolicy()
+
+# Per-session state lives in a gr.State dict: {'session_id', 'user_id', 'user_email', 'job_id', 'history'}.
+# Jobs themselves are owned by the shared job_manager, so several users can send at once.
+
+def _session_user(session):
+    return session.get('user_id') if session else None
 
 # --- Authentication UI and Logic ---
-def login_ui_logic(email, password):
-    global global_user_id, global_user_email
+def login_ui_logic(email, password, session):
     uid, user_email, error = auth_manager.login_user(email, password)
 
     if error:
-        return f"Login Failed: {error}", gr.update(visible=True), gr.update(visible=False), None # Return None for email display
+        return f"Login Failed: {error}", gr.update(visible=True), gr.update(visible=False), gr.update(visible=False), None, session # Return None for email display
     else:
-        global_user_id = uid
-        global_user_email = user_email
+        session = {'session_id': uuid.uuid4().hex, 'user_id': uid, 'user_email': user_email, 'job_id': None}
         print(f"User {user_email} (UID: {uid}) logged in successfully.")
-        # After successful login, hide login tab and show sender tab
-        return "Login Successful! Redirecting...", gr.update(visible=False), gr.update(visible=True), f"Logged in as: **{global_user_email}**" # Update email display
-
-def logout_ui_logic():
-    global global_user_id, global_user_email, email_logs, global_initial_df
-    global_user_id = None
-    global_user_email = None
-    email_logs = []
-    global_initial_df = None
+        # After successful login, hide login tab and show sender and history tabs
+        return ("Login Successful! Redirecting...", gr.update(visible=False), gr.update(visible=True), gr.update(visible=True),
+                f"Logged in as: **{user_email}**", session) # Update email display
+
+def logout_ui_logic(session):
+    if session and session.get('job_id'):
+        job_manager.forget(session['job_id']) # Only drops the record once the job has finished
     print("User logged out.")
-    # After logout, show login tab and hide sender tab, reset all fields
-    return "Logged out successfully.", gr.update(visible=True), gr.update(visible=False), "", None, "", "", None, f"Logged in as: **Guest**" # Reset email display
+    # After logout, show login tab and hide sender and history tabs, reset all fields
+    return ("Logged out successfully.", gr.update(visible=True), gr.update(visible=False), gr.update(visible=False), "", None, "", "", "", None,
+            f"Logged in as: **Guest**", "Campaign history will appear here.", "", "", None) # Reset email display, history and session
 
 # --- Email Sending UI and Logic ---
-def start_sending_ui_logic(sender_email_input, excel_file_input, subject_template_input, body_template_input, progress=gr.Progress()):
-    global current_send_job, email_logs, global_user_id, global_initial_df
-
-    if not global_user_id:
-        return "Error: Not logged in. Please log in first.", "", None
+def start_sending_ui_logic(sender_email_input, excel_file_input, subject_template_input, body_template_input, html_template_input, profile_job, session):
+    """Generator: streams status and live log updates to the dashboard while the campaign runs."""
+    if not _session_user(session):
+        yield "Error: Not logged in. Please log in first.", "", None, session
+        return
 
-    if not GMAIL_APP_PASSWORD:
-        return "Error: GMAIL_APP_PASSWORD not set in environment variables. Please check your deployment secrets or .env file.", "", None
+    if not GMAIL_APP_PASSWORD and not sender_pool.configured:
+        yield "Error: GMAIL_APP_PASSWORD not set in environment variables (and no SENDER_ACCOUNTS configured). Please check your deployment secrets or .env file.", "", None, session
+        return
 
     if not excel_file_input:
-        return "Error: Please upload an Excel file.", "", None
-
-    email_logs = [] # Reset logs for a new sending operation
-    current_send_job["running"] = True
-    current_send_job["interrupt"] = False
-
-    # Process Excel file
-    initial_df, recipients, excel_error = excel_manager.process_excel_for_sending(excel_file_input)
+        yield "Error: Please upload an Excel file.", "", None, session
+        return
+
+    job_id = datetime.now().strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+    yield from run_campaign(session, job_id, sender_email_input, excel_file_input, subject_template_input, body_template_input,
+                            html_template_input, profile=profile_job)
+
+def resume_job_ui_logic(job_id, profile_job, session):
+    """Resumes an unfinished job from the local journal, sending only to recipients without a recorded outcome."""
+    user_id = _session_user(session)
+    if not user_id:
+        yield "Error: Not logged in. Please log in first.", "", None, session
+        return
+
+    if not GMAIL_APP_PASSWORD and not sender_pool.configured:
+        yield "Error: GMAIL_APP_PASSWORD not set in environment variables (and no SENDER_ACCOUNTS configured). Please check your deployment secrets or .env file.", "", None, session
+        return
+
+    job = job_journal.get_job(job_id) if job_id else None
+    if not job or job['user_id'] != user_id:
+        yield "Error: Please select one of your unfinished jobs to resume.", "", None, session
+        return
+    if job_manager.get(job_id, user_id) and not job_manager.get(job_id, user_id).done:
+        yield "Error: This job is already running.", "", None, session
+        return
+
+    try:
+        with open(job['source_path'], 'rb') as f:
+            source_bytes = f.read()
+    except OSError as e:
+        yield f"Error: Could not read the recipient file saved for this job: {e}", "", None, session
+        return
+
+    yield from run_campaign(session, job_id, job['sender_email'], source_bytes, job['subject_template'], job['body_template'],
+                            job['html_template'], resume=True, profile=profile_job)
+
+def refresh_resumable_jobs_ui_logic(session):
+    """Lists the logged-in user's jobs that still have recipients without an outcome."""
+    user_id = _session_user(session)
+    jobs = job_journal.resumable_jobs(user_id) if user_id else []
+    choices = [(f"{job['job_id']} ({job['done']}/{job['total']} done)", job['job_id']) for job in jobs]
+    return gr.update(choices=choices, value=choices[0][1] if choices else None)
+
+def run_campaign(session, job_id, sender_email_input, excel_file_input, subject_template_input, body_template_input, html_template_input=None,
+                 resume=False, profile=False):
+    """
+    Prepares (or resumes) a campaign and hands it to the shared job manager, which sends it on a
+    pool thread and records each recipient's outcome in the job journal as it completes.
+    This generator yields (status, live logs, download, session) updates at most every
+    LIVE_REFRESH_INTERVAL seconds until the job ends. With `profile`, the job runs under cProfile
+    and the stats are saved next to its results.
+    """
+    user_id = session['user_id']
+
+    # Open the Excel file; only its header is read until the templates have been checked
+    stream, excel_error = excel_manager.open_recipient_stream(excel_file_input)
     if excel_error:
-        current_send_job["running"] = False
-        return f"Error: {excel_error}", "", None
-    if not recipients:
-        current_send_job["running"] = False
-        return "No recipients found in the Excel file.", "", None
-
-    global_initial_df = initial_df # Store for final Excel generation
+        yield f"Error: {excel_error}", "", None, session
+        return
+
+    # Parse the templates once and check every placeholder against the uploaded columns before sending
+    templates, template_error = template_manager.compile_templates(subject_template_input, body_template_input, stream.columns,
+                                                                   html_template_input)
+    if template_error:
+        stream.close()
+        yield f"Error: {template_error}", "", None, session
+        return
+
+    # Invalid and duplicate addresses are filtered out up front and reported as rejects; each recipient
+    # only keeps the columns the templates use
+    initial_df, recipients, rejects, excel_error = excel_manager.read_recipients(stream, fields=templates.columns())
+    if excel_error:
+        yield f"Error: {excel_error}", "", None, session
+        return
+
+    completed_rows = set()
+    if resume:
+        # Skip everyone who already has an outcome in the journal. This comes before the suppression
+        # check, so a recipient who bounced in the first run keeps that outcome instead of being skipped.
+        completed_rows = job_journal.completed_rows(job_id)
+        recipients = [recipient for recipient in recipients if recipient['row'] not in completed_rows]
+        print(f"Resuming job {job_id}: {len(completed_rows)} recipients already done, {len(recipients)} pending.")
+
+    # Drop earlier hard bounces and unsubscribes in one pass; they are reported like other skipped rows
+    synced, sync_error = suppression_list.sync(user_id)
+    if sync_error:
+        print(f"{sync_error}. Using the locally cached suppression list.")
+    recipients, suppressed = suppression_list.filter_recipients(user_id, recipients)
+    if suppressed:
+        print(f"Skipping {len(suppressed)} suppressed recipients (earlier hard bounces or unsubscribes).")
+        initial_df = initial_df.drop(index=[reject['row'] for reject in suppressed])
+        rejects = rejects + suppressed
+
+    if not recipients and not completed_rows:
+        yield f"No valid recipients found in the Excel file ({len(rejects)} rows rejected or suppressed).", "", None, session
+        return
+
+    job = SendJob(job_id, user_id, session['session_id'])
+
+    # The journal says "queued" until execute starts, so a job stopped in the queue never shows as running
+    if not resume:
+        source_path = save_source(job_id, excel_file_input) # Kept so the job can be resumed after a restart
+        job_journal.create_job(job_id, user_id, sender_email_input, subject_template_input,
+                               body_template_input, source_path, len(recipients), html_template_input)
+    else:
+        job_journal.set_job_status(job_id, "queued")
+    results_writer = None # Opened by execute, so a job cancelled while queued holds no file handle
 
     total_recipients = len(recipients)
-    progress(0, desc="Starting email send...")
-
-    for i, recipient in enumerate(recipients):
-        if current_send_job["interrupt"]:
-            message = "Email sending interrupted by user."
-            print(message)
-            break # Exit the loop if stop is requested
-
+    if rejects:
+        print(f"Skipping {len(rejects)} rejected rows (invalid, duplicate or suppressed emails).")
+    live_log = LiveLog(total_recipients)
+    job.live_log = live_log
+
+    # Recipients are spread over the sender accounts by rate, within each account's daily quota,
+    # with receiving domains interleaved. Whatever no account has quota for stays pending for a resume.
+    # The plan is made when the job starts running (see execute), since it reserves quota.
+    accounts = sender_pool.accounts_for(sender_email_input, GMAIL_APP_PASSWORD)
+    for account in accounts:
+        send_scheduler.bucket_for(account.email, account.rate, account.burst)
+    account_by_row = {} # row -> SenderAccount, filled in by the plan
+    job_counts = {} # account email -> messages handled in this job
+
+    # Headers, boundaries and part headers are encoded once per sender; each send only splices in its own fields
+    skeletons = {account.email: email_manager.prepare_campaign(account.email, with_html=templates.has_html) for account in accounts}
+
+    attempts_by_row = {} # row -> sends so far; a row is never in flight twice at once
+
+    def send_one(item):
+        # Runs on a scheduler worker thread; subject and bodies were already rendered in batches
+        recipient, personalized_subject, personalized_body, personalized_html = item
+        account = account_by_row[recipient['row']]
+        attempt = attempts_by_row[recipient['row']] = attempts_by_row.get(recipient['row'], 0) + 1
+        retrying = f" (attempt {attempt})" if attempt > 1 else ""
+        print(f"Sending to {recipient['name']} ({recipient['email']}) from {account.email}{retrying}...")
+        with send_loop_seconds.time(step="send"):
+            success, send_error, code, transient, bounce = email_manager.deliver(
+                account.email, account.app_password, recipient['email'], personalized_subject, personalized_body,
+                html_body=personalized_html, skeleton=skeletons[account.email]
+            )
+        return success, send_error, datetime.now(), code, transient, bounce, attempt
+
+    def retry_delay(item, result, attempts):
+        # Transient failures (4xx, dropped connections) go back on the scheduler's deferred queue
+        success, send_error, _, code, transient, _, _ = result
+        if success or not transient:
+            return None
+        delay = retry_policy.delay_for(attempts)
+        if delay is not None:
+            live_log.retry_scheduled(item[0]['row'])
+            send_retries_total.inc(code=str(code or "none"))
+            print(f"Transient failure for {item[0]['email']} ({send_error}); retrying in {delay:.1f}s.")
+        return delay
+
+    def _record_result(item, result):
+        # Called on the job's thread, in recipient order except for retried recipients, so the live log stays sequential
+        recipient, personalized_subject, personalized_body, _ = item
+        success, send_error, sent_at, code, transient, bounce, attempts = result
         name = recipient['name']
         email = recipient['email']
-
-        # Personalize subject and body
-        personalized_subject = subject_template_input.replace("{Name}", name)
-        personalized_body = body_template_input.replace("{Name}", name)
-
-        status_msg = f"Sending to {name} ({email})..."
-        print(status_msg)
-        progress((i + 1) / total_recipients, desc=status_msg)
-
-        # Send email
-        success, send_error = email_manager.send_email_via_smtp(
-            sender_email_input, GMAIL_APP_PASSWORD, email, personalized_subject, personalized_body
-        )
+        account = account_by_row[recipient['row']]
 
         log_status = "sent" if success else "failed"
         log_error_msg = send_error if not success else None
+        job_journal.record(job_id, recipient['row'], log_status, log_error_msg, sender=account.email,
+                           attempts=attempts, response_code=code) # Committed before anything else
+        sender_pool.record(account, success)
+        job_counts[account.email] = job_counts.get(account.email, 0) + 1
+        if bounce:
+            suppression_list.add(user_id, [email]) # Recipient refused at RCPT: never mailed again by this user
 
         # Create log entry for current send
         log_entry = {
-            'userId': global_user_id,
+            'userId': user_id,
+            'jobId': job_id,
+            'row': recipient['row'],
+            'sender': account.email,
             'email': email,
             'name': name,
             'subject': personalized_subject,
             'body_preview': personalized_body[:100] + '...' if len(personalized_body) > 100 else personalized_body,
-            'timestamp': datetime.now(),
+            'timestamp': sent_at,
             'status': log_status,
-            'error': log_error_msg
+            'error': log_error_msg,
+            'attempts': attempts,
+            'responseCode': code,
+            'bounce': bounce # Read by the suppression sync; auth and sender errors are not bounces
         }
-        email_logs.append(log_entry) # Add to session logs
-
-        # Log to Firebase Firestore
+        live_log.record(log_entry) # Bounded: only recent entries are kept for display
+        results_writer.record(recipient['row'], name, email, log_status, log_error_msg, sent_at, attempts, code)
+        log_writer.add(log_entry) # Queued; committed to Firestore in batches off the send path
+
+    def record_result(i, item, result):
+        with send_loop_seconds.time(step="record"):
+            _record_result(item, result)
+
+    deferred_rows = [] # Recipients still waiting for a retry when the job was stopped
+
+    def record_deferred(i, item, result):
+        # No outcome yet: journaled as deferred (not failed), so Resume Job sends to them again
+        recipient = item[0]
+        _, send_error, sent_at, code, _, _, attempts = result
+        deferred_rows.append(recipient['row'])
+        job_journal.record(job_id, recipient['row'], DEFERRED, send_error, sender=account_by_row[recipient['row']].email,
+                           attempts=attempts, response_code=code)
+        results_writer.record(recipient['row'], recipient['name'], recipient['email'], DEFERRED, send_error, sent_at, attempts, code)
+
+    log_writer = FirestoreLogWriter()
+    profiler = JobProfiler() if profile else None
+
+    def execute(job):
+        # Runs on a job manager pool thread, so the job finishes even if the browser disconnects
+        nonlocal results_writer
+        # Outcomes are appended to a per-job CSV sidecar as they complete, keyed by original row
+        results_writer = job.results_writer = ResultsWriter(job_id)
+        job_journal.set_job_status(job_id, "running")
+        log_writer.replay_spilled() # Retry entries left over from earlier failed commits
+        log_writer.start()
+
+        # Planned (and the quota reserved) only now, so queued jobs don't hold quota and concurrent
+        # jobs see each other's reservations
+        plan, over_quota = sender_pool.plan(recipients, accounts)
+        account_by_row.update((recipient['row'], account) for recipient, account in plan)
+
+        # Sends run on a worker pool paced by a per-sender token bucket instead of a fixed delay
+        dispatched = 0
+        run_args = dict(
+            items=templates.iter_rendered([recipient for recipient, _ in plan], initial_df),
+            send_fn=send_one if profiler is None else (lambda item: profiler.call(send_one, item)),
+            on_result=record_result,
+            should_stop=lambda: job.interrupted,
+            sender_key=lambda item: account_by_row[item[0]['row']].email, # Each account has its own token bucket
+            retry_delay=retry_delay,
+            on_deferred=record_deferred,
+        )
         try:
-            db.collection('emailLogs').add(log_entry)
-            print(f"Logged to Firestore for {email}: {log_status}")
+            if profiler is None:
+                dispatched = send_scheduler.run(**run_args)
+            else:
+                dispatched = profiler.call(send_scheduler.run, **run_args) # Worker threads profile their own sends
         except Exception as e:
-            print(f"Error logging to Firestore for {email}: {e}")
-
-        # Add delay for responsible sending
-        time.sleep(20)
-
-    current_send_job["running"] = False # Mark job as finished/interrupted
-
-    # Generate final Excel for download
-    final_excel_buffer, excel_gen_error = excel_manager.generate_final_excel(global_initial_df, email_logs)
-    if excel_gen_error:
-        final_excel_output = None
-        final_excel_message = f"Error generating final Excel: {excel_gen_error}"
-    else:
-        final_excel_output = final_excel_buffer.getvalue() # Get bytes for download
-        final_excel_message = "Email sending complete (or interrupted)!"
-
-    # Prepare current logs for display in Gradio
-    current_logs_display_df = pd.DataFrame(email_logs)
-    current_logs_display_md = current_logs_display_df.to_markdown(index=False) if not current_logs_display_df.empty else "No logs yet."
+            job.error = str(e)
+            print(f"Error while sending: {e}")
+        finally:
+            log_writer.close() # Flushes whatever is still queued, on completion or interrupt
+            results_writer.close()
+            finished = dispatched == total_recipients and not deferred_rows
+            job_journal.set_job_status(job_id, "completed" if finished else "interrupted")
+            for account in accounts: # Hand back the quota reserved for sends this job didn't make
+                planned = sum(1 for chosen in account_by_row.values() if chosen is account)
+                sender_pool.release(account, planned - job_counts.get(account.email, 0))
+            if not [other for other in job_manager.active_jobs() if other is not job]:
+                email_manager.close() # Release pooled SMTP sessions once no campaign is using them
+        if job.interrupted:
+            print(f"Email sending interrupted by user for job {job_id}.")
+
+        # Generate final Excel for download from the recorded outcomes
+        final_excel_path, excel_gen_error = results_writer.write_final_report(initial_df, rejects)
+        if excel_gen_error:
+            job.output_path = results_writer.partial_report_path() # Fall back to the raw CSV results
+            job.message = f"Error generating final Excel: {excel_gen_error}"
+        else:
+            job.output_path = final_excel_path
+            job.message = "Email sending complete (or interrupted)!"
+            if rejects:
+                job.message += f" Skipped {len(rejects)} rows with invalid, duplicate or suppressed emails."
+        if over_quota and not job.interrupted:
+            job.message += (f" {over_quota} recipients were not sent because every sender account reached its daily quota;"
+                            f" resume this job later to send them.")
+        if deferred_rows:
+            job.message += (f" {len(deferred_rows)} recipients were waiting to retry a temporary failure when the job stopped;"
+                            f" resume this job to send them.")
+        if job.error:
+            job.message = f"Sending stopped on an error: {job.error}"
+        if profiler is not None:
+            profile_path = os.path.join(os.path.dirname(results_writer.path), f"{job_id}_profile.prof")
+            print(profiler.save(profile_path))
+            job.message += f" cProfile stats saved to {profile_path}."
+
+    if session.get('job_id'):
+        job_manager.forget(session['job_id']) # This session's previous job, if it has finished
+    session = dict(session, job_id=job_id)
+    job_manager.submit(job, execute)
+
+    # Throttled refresh: one dashboard update per interval, whatever the send rate
+    while not job.done:
+        if job.status == QUEUED:
+            yield (f"**Queued:** waiting for a free sending slot (position {job_manager.queue_position(job)} "
+                   f"in your queue)."), "", gr.update(), session
+        else:
+            yield (live_log.render_status() + "\n\n" + sender_pool.render_accounts(accounts, job_counts),
+                   live_log.render_logs(), gr.update(), session)
+        job.wait(LIVE_REFRESH_INTERVAL)
+
+    final_output = gr.update(value=job.output_path, interactive=True) if job.output_path else gr.update()
+    yield (live_log.render_status(job.message or "Job finished.") + "\n\n" + sender_pool.render_accounts(accounts, job_counts),
+           live_log.render_logs(), final_output, session)
+
+def download_partial_results_ui_logic(session):
+    """Returns the results recorded so far for this session's current (or last) job."""
+    job = job_manager.get(session.get('job_id'), _session_user(session)) if session else None
+    if job is None or job.results_writer is None:
+        return "No sending job has started yet.", None
+    return "Partial results are ready to download.", job.results_writer.partial_report_path()
+
+def refresh_sender_accounts_ui_logic(sender_email_input):
+    """Today's counts and quota headroom for each sender account."""
+    if not sender_pool.configured and not sender_email_input:
+        return "Enter a sender address, or configure SENDER_ACCOUNTS for a pool of senders."
+    return sender_pool.render_accounts(sender_pool.accounts_for(sender_email_input, GMAIL_APP_PASSWORD))
+
+def unsubscribe_ui_logic(addresses_text, session):
+    """Adds the pasted addresses (one per line or comma-separated) to the user's suppression list."""
+    user_id = _session_user(session)
+    if not user_id:
+        return "Error: Not logged in. Please log in first.", addresses_text
+    emails = [address for address in addresses_text.replace(',', '\n').splitlines() if address.strip()] if addresses_text else []
+    if not emails:
+        return "Enter at least one email address to suppress.", addresses_text
+    added, error = suppression_list.unsubscribe(user_id, emails)
+    if error:
+        return f"Error: {error}", addresses_text
+    return f"Suppressed {added} addresses. Your suppression list now has {suppression_list.count(user_id)} entries.", ""
 
-    return final_excel_message, current_logs_display_md, gr.File(value=(final_excel_output, "email_results.xlsx"), interactive=True, type="bytes")
+def refresh_metrics_ui_logic():
+    """Current hot-path timings and counters, in the Prometheus text format."""
+    return registry.render()
 
-def stop_sending_ui_logic():
-    """Interrupts the current sending job."""
-    if current_send_job["running"]:
-        current_send_job["interrupt"] = True
+def stop_sending_ui_logic(session):
+    """Interrupts this session's sending job."""
+    if session and job_manager.stop(session.get('job_id'), _session_user(session)):
         return "Attempting to stop. Please wait for the current email to finish sending.", gr.update(interactive=False)
     return "No active sending job to stop.", gr.update(interactive=False)
 
+# --- Campaign History UI and Logic ---
+def _show_history_page(session, history):
+    """Loads the page `history` points at. Returns (status, logs, totals, previous button, next button, session)."""
+    user_id = session['user_id']
+    entries, next_cursor, error = campaign_history.page(user_id, history['start'], history['end'], history['status'],
+                                                        history['cursors'][-1])
+    session = dict(session, history=dict(history, next=next_cursor))
+    page_number = len(history['cursors'])
+    if error:
+        return f"Error: {error}", "", "", gr.update(interactive=page_number > 1), gr.update(interactive=False), session
+    # Totals for the campaigns on this page only; cached, so paging back and forth doesn't recount them
+    totals, totals_error = campaign_history.campaign_totals(user_id, [entry['jobId'] for entry in entries if entry.get('jobId')])
+    status = f"Page {page_number}: {len(entries)} emails, newest first."
+    if totals_error:
+        status += f" {totals_error}"
+    return (status, campaign_history.render_page(entries), campaign_history.render_totals(totals),
+            gr.update(interactive=page_number > 1), gr.update(interactive=next_cursor is not None), session)
+
+def load_history_ui_logic(start_date, end_date, status_filter, session):
+    """First page of the logged-in user's emailLogs for the given dates (YYYY-MM-DD, both included) and status."""
+    if not _session_user(session):
+        return "Error: Not logged in. Please log in first.", "", "", gr.update(interactive=False), gr.update(interactive=False), session
+    try:
+        start, end = parse_date_range(start_date, end_date)
+    except ValueError:
+        return ("Error: Dates must be in YYYY-MM-DD format.", gr.update(), gr.update(), gr.update(), gr.update(), session)
+    # Each page starts after the last document of the one before; the stack of cursors allows paging back
+    history = {'start': start, 'end': end, 'status': status_filter or None, 'cursors': [None], 'next': None}
+    return _show_history_page(session, history)
+
+def next_history_page_ui_logic(session):
+    history = session.get('history') if session else None
+    if not _session_user(session) or not history or history.get('next') is None:
+        return "No more emails.", gr.update(), gr.update(), gr.update(), gr.update(interactive=False), session
+    return _show_history_page(session, dict(history, cursors=history['cursors'] + [history['next']]))
+
+def previous_history_page_ui_logic(session):
+    history = session.get('history') if session else None
+    if not _session_user(session) or not history or len(history['cursors']) < 2:
+        return "Already on the first page.", gr.update(), gr.update(), gr.update(interactive=False), gr.update(), session
+    return _show_history_page(session, dict(history, cursors=history['cursors'][:-1]))
+
 # --- Gradio Interface Definition ---
 with gr.Blocks() as demo:
     gr.Markdown("# 📧 Cloud-Based Email Automation Tool")
 
+    session_state = gr.State(None) # Per-browser-session login and job reference
+
     # Store a reference to the sender tab, so we can control its visibility programmatically
     sender_tab_block = None 
 
@@ -175,27 +474,63 @@ with gr.Blocks() as demo:
         gr.Markdown("---")
 
         with gr.Row():
-            sender_email_input = gr.Textbox(label="Your Gmail Address (Sender)", placeholder="your.gmail@gmail.com", interactive=True)
-            excel_upload_input = gr.File(label="Upload Recipients Excel (.xlsx) [Cols: Name, Email]", type="bytes", file_count="single", interactive=True)
+            sender_email_input = gr.Textbox(label="Your Gmail Address (Sender; not used when SENDER_ACCOUNTS is configured)", placeholder="your.gmail@gmail.com", interactive=True)
+            excel_upload_input = gr.File(label="Upload Recipients Excel (.xlsx) or CSV [Cols: Name, Email]", type="binary", file_count="single", interactive=True)
 
-        subject_input = gr.Textbox(label="Email Subject (Use {Name} for personalization)", placeholder="Hello {Name}, a special offer for you!")
-        body_input = gr.Textbox(label="Email Body (Use {Name} for personalization)", lines=10, placeholder="Hi {Name},\n\nWe wanted to share some exciting news with you...\n\nBest regards,\nYour Team")
+        subject_input = gr.Textbox(label="Email Subject (Use {Name} or any column, e.g. {Company|default}, for personalization)", placeholder="Hello {Name}, a special offer for you!")
+        body_input = gr.Textbox(label="Email Body (Use {Name} or any column, e.g. {Company|default}, for personalization)", lines=10, placeholder="Hi {Name},\n\nWe wanted to share some exciting news with you...\n\nBest regards,\nYour Team")
+        html_body_input = gr.Textbox(label="HTML Body (optional, sent alongside the plain-text body; same placeholders, write {{ and }} for literal braces)", lines=6, placeholder="<p>Hi {Name},</p>\n<p>We wanted to share some exciting news with you...</p>")
 
         with gr.Row():
             start_send_btn = gr.Button("Start Sending Emails", variant="primary")
             stop_send_btn = gr.Button("STOP Sending", variant="secondary", interactive=False)
+            partial_results_btn = gr.Button("Download Partial Results", variant="secondary")
             logout_btn = gr.Button("Logout", variant="secondary")
 
+        with gr.Row():
+            resume_job_dropdown = gr.Dropdown(label="Unfinished Jobs", choices=[], interactive=True)
+            refresh_jobs_btn = gr.Button("Refresh Unfinished Jobs", variant="secondary")
+            resume_job_btn = gr.Button("Resume Job", variant="secondary")
+
         sending_status_output = gr.Markdown("Status: Ready to send.")
         live_logs_output = gr.Markdown("Live Sending Logs will appear here.")
         download_results_output = gr.File(label="Download Final Results Excel (.xlsx)", file_count="single", interactive=False)
 
+        with gr.Accordion("Sender Accounts", open=False):
+            sender_accounts_output = gr.Markdown("Per-account send counts and daily quota headroom appear here.")
+            refresh_senders_btn = gr.Button("Refresh Sender Accounts", variant="secondary")
+
+        with gr.Accordion("Suppression List (Unsubscribes)", open=False):
+            gr.Markdown("Addresses that hard-bounced in earlier campaigns are skipped automatically. Add unsubscribes here.")
+            unsubscribe_input = gr.Textbox(label="Email addresses to suppress (one per line or comma-separated)", lines=3)
+            unsubscribe_btn = gr.Button("Add to Suppression List", variant="secondary")
+            unsubscribe_status_output = gr.Markdown("")
+
+        with gr.Accordion("Performance Metrics", open=False):
+            profile_job_checkbox = gr.Checkbox(label="Profile the next job with cProfile (stats are saved next to its results)", value=False)
+            metrics_output = gr.Code(label="Per-phase timings and counters (Prometheus text format)", language=None, interactive=False)
+            refresh_metrics_btn = gr.Button("Refresh Metrics", variant="secondary")
+
+    with gr.Tab("Campaign History", visible=False) as history_tab_block: # Shown after login
+        gr.Markdown("## Past Campaigns")
+        with gr.Row():
+            history_start_input = gr.Textbox(label="From (YYYY-MM-DD)", placeholder="2024-01-01")
+            history_end_input = gr.Textbox(label="To (YYYY-MM-DD)", placeholder="2024-12-31")
+            history_status_input = gr.Dropdown(label="Status", choices=[("All", ""), ("Sent", "sent"), ("Failed", "failed")], value="")
+            load_history_btn = gr.Button("Load History", variant="primary")
+        history_status_output = gr.Markdown("Campaign history will appear here.")
+        history_totals_output = gr.Markdown("")
+        history_logs_output = gr.Markdown("")
+        with gr.Row():
+            previous_history_btn = gr.Button("Previous Page", variant="secondary", interactive=False)
+            next_history_btn = gr.Button("Next Page", variant="secondary", interactive=False)
+
     # --- Button Clicks and UI Updates ---
     login_btn.click(
         login_ui_logic,
-        inputs=[email_input, password_input],
-        outputs=[login_status_output, login_tab_block, sender_tab_block_init, user_display_markdown], # Pass user_display_markdown to be updated
-        _js="""
+        inputs=[email_input, password_input, session_state],
+        outputs=[login_status_output, login_tab_block, sender_tab_block_init, history_tab_block, user_display_markdown, session_state], # Pass user_display_markdown to be updated
+        js="""
         (status, login_tab_comp, sender_tab_comp, user_markdown_comp) => {
             if (status.includes("Successful")) {
                 const loginTabButton = document.querySelector('button[data-tab-id="0"]'); // Assuming login is the first tab
@@ -214,35 +549,111 @@ with gr.Blocks() as demo:
         queue=False # This UI update should happen instantly
     ).then(
         start_sending_ui_logic,
-        inputs=[sender_email_input, excel_upload_input, subject_input, body_input],
-        outputs=[sending_status_output, live_logs_output, download_results_output],
+        inputs=[sender_email_input, excel_upload_input, subject_input, body_input, html_body_input, profile_job_checkbox, session_state],
+        outputs=[sending_status_output, live_logs_output, download_results_output, session_state],
     ).then(
         lambda: gr.update(interactive=False), # Disable stop button after sending is done
         outputs=[stop_send_btn],
         queue=False
     )
 
+    refresh_jobs_btn.click(
+        refresh_resumable_jobs_ui_logic,
+        inputs=[session_state],
+        outputs=[resume_job_dropdown],
+        queue=False
+    )
+
+    resume_job_btn.click(
+        lambda: gr.update(interactive=True), # Enable stop button immediately
+        outputs=[stop_send_btn],
+        queue=False
+    ).then(
+        resume_job_ui_logic,
+        inputs=[resume_job_dropdown, profile_job_checkbox, session_state],
+        outputs=[sending_status_output, live_logs_output, download_results_output, session_state],
+    ).then(
+        lambda: gr.update(interactive=False), # Disable stop button after sending is done
+        outputs=[stop_send_btn],
+        queue=False
+    )
+
+    partial_results_btn.click(
+        download_partial_results_ui_logic,
+        inputs=[session_state],
+        outputs=[sending_status_output, download_results_output],
+        queue=False
+    )
+
+    refresh_senders_btn.click(
+        refresh_sender_accounts_ui_logic,
+        inputs=[sender_email_input],
+        outputs=[sender_accounts_output],
+        queue=False
+    )
+
+    unsubscribe_btn.click(
+        unsubscribe_ui_logic,
+        inputs=[unsubscribe_input, session_state],
+        outputs=[unsubscribe_status_output, unsubscribe_input]
+    )
+
+    refresh_metrics_btn.click(
+        refresh_metrics_ui_logic,
+        outputs=[metrics_output],
+        queue=False
+    )
+
+    history_outputs = [history_status_output, history_logs_output, history_totals_output,
+                       previous_history_btn, next_history_btn, session_state]
+
+    load_history_btn.click(
+        load_history_ui_logic,
+        inputs=[history_start_input, history_end_input, history_status_input, session_state],
+        outputs=history_outputs
+    )
+
+    next_history_btn.click(
+        next_history_page_ui_logic,
+        inputs=[session_state],
+        outputs=history_outputs
+    )
+
+    previous_history_btn.click(
+        previous_history_page_ui_logic,
+        inputs=[session_state],
+        outputs=history_outputs
+    )
+
     stop_send_btn.click(
         stop_sending_ui_logic,
+        inputs=[session_state],
         outputs=[sending_status_output, stop_send_btn],
         queue=False # This UI update should happen instantly
     )
 
     logout_btn.click(
         logout_ui_logic,
+        inputs=[session_state],
         outputs=[
             login_status_output,       # Login status message
             login_tab_block,           # Login tab visibility
             sender_tab_block_init,     # Sender tab visibility
+            history_tab_block,         # History tab visibility
             sender_email_input,        # Clear sender email input
             excel_upload_input,        # Clear excel upload
             subject_input,             # Clear subject
             body_input,                # Clear body
+            html_body_input,           # Clear HTML body
             download_results_output,   # Clear download output
-            user_display_markdown      # Update user display markdown
+            user_display_markdown,     # Update user display markdown
+            history_status_output,     # Reset history status
+            history_logs_output,       # Clear history logs
+            history_totals_output,     # Clear campaign totals
+            session_state              # Clear the session
         ],
-        _js="""
-        (status, login_tab_comp, sender_tab_comp, sender_email_val, excel_upload_val, subject_val, body_val, download_output_val, user_markdown_comp) => {
+        js="""
+        (status, login_tab_comp, sender_tab_comp, sender_email_val, excel_upload_val, subject_val, body_val, html_body_val, download_output_val, user_markdown_comp) => {
             const loginTabButton = document.querySelector('button[data-tab-id="0"]');
             const senderTabButton = document.querySelector('button[data-tab-id="1"]');
             if (loginTabButton) loginTabButton.style.display = 'block'; // Show login tab button
@@ -252,7 +663,7 @@ with gr.Blocks() as demo:
             // Note: For File and Textbox components, assigning null or empty string might not visually clear them immediately
             // without a full Gradio refresh or specific JS to manipulate the internal component state.
             // However, the backend state will be reset.
-            return [status, login_tab_comp, sender_tab_comp, "", null, "", "", null, user_markdown_comp]; // Return null for inputs to clear them (backend state)
+            return [status, login_tab_comp, sender_tab_comp, "", null, "", "", "", null, user_markdown_comp]; // Return null for inputs to clear them (backend state)
         }
         """
     )
@@ -260,4 +671,7 @@ with gr.Blocks() as demo:
 
 # Launch the Gradio app
 if __name__ == "__main__":
+    start_metrics_server() # Only when METRICS_PORT is set
+    # Initialize Firebase in the background so credential problems are reported at startup without delaying it
+    threading.Thread(target=firebase_handler.ensure_initialized, name="firebase-init", daemon=True).start()
     demo.launch(debug=True, share=False) # Set share=True for a public temporary link for testing
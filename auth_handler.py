@@ -1,11 +1,69 @@
 # auth_handler.py
-from firebase_handler import auth_client, db # Import initialized auth_client and db
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from firebase_handler import get_auth, get_db, not_found_error # Lazily initialized Auth and Firestore accessors
 from datetime import datetime
 
+# Seconds a resolved user record is reused before Firebase Auth is asked again.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+
 class AuthHandler:
-    def __init__(self):
-        if not auth_client:
+    def __init__(self, auth=None, db=None, cache_ttl=AUTH_CACHE_TTL):
+        """
+        `auth` and `db` default to the Firebase Admin SDK clients, which are initialized on first
+        use rather than here; pass fakes (see fake_auth.py and fake_firestore.py) to run or
+        benchmark logins locally.
+        """
+        self._auth = auth
+        self._db = db
+        self.cache_ttl = cache_ttl
+        self._cache = {} # lowercased email -> (expires_at, user record)
+        self._cache_lock = threading.Lock()
+        # Profile writes happen here, off the login request path
+        self._profile_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="auth-profile-writer")
+
+    @property
+    def auth(self):
+        auth = self._auth if self._auth is not None else get_auth()
+        if not auth:
             raise ValueError("Firebase Auth client is not initialized. Check firebase_handler.py.")
+        return auth
+
+    @property
+    def db(self):
+        return self._db if self._db is not None else get_db()
+
+    def _get_user(self, email):
+        """Returns the Firebase user record for an email, from the TTL cache when possible."""
+        key = email.strip().lower()
+        now = time.monotonic()
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] > now:
+                return cached[1]
+        user = self.auth.get_user_by_email(email) # Raises if the user doesn't exist
+        with self._cache_lock:
+            self._cache[key] = (now + self.cache_ttl, user)
+        return user
+
+    def _upsert_profile(self, user, login_time):
+        # Returning users only get lastLogin updated, without reading the profile first; the update
+        # raises NotFound when there is no profile yet, and the profile is created with this login as createdAt.
+        try:
+            user_ref = self.db.collection('users').document(user.uid)
+            try:
+                user_ref.update({'lastLogin': login_time})
+            except not_found_error():
+                user_ref.create({
+                    'email': user.email,
+                    'displayName': user.display_name or user.email.split('@')[0],
+                    'createdAt': login_time,
+                    'lastLogin': login_time,
+                })
+        except Exception as e:
+            print(f"Error updating user profile for {user.email}: {e}")
 
     def login_user(self, email, password):
         """
@@ -18,10 +76,12 @@ class AuthHandler:
         For this demo, we'll verify user existence and mock a session.
         You MUST create users manually in Firebase Console -> Authentication -> Users
         for this login to work.
+        The user lookup is cached for AUTH_CACHE_TTL seconds and the Firestore profile
+        (including lastLogin) is written in the background.
         """
         try:
             # Attempt to get user by email. If it fails, user doesn't exist or is disabled.
-            user = auth_client.get_user_by_email(email)
+            user = self._get_user(email)
 
             # In a real app, you'd securely compare the password hash or verify an ID token.
             # For this simple Gradio demo without client-side JS, we will
@@ -29,19 +89,16 @@ class AuthHandler:
             # THIS IS A SIMPLIFICATION FOR DEMO PURPOSES.
             # A more secure approach for password verification would be needed for production.
 
-            # Store/update user info in Firestore
-            user_ref = db.collection('users').document(user.uid)
-            if not user_ref.get().exists:
-                user_ref.set({
-                    'email': user.email,
-                    'displayName': user.display_name or user.email.split('@')[0],
-                    'createdAt': datetime.now()
-                })
-            user_ref.update({'lastLogin': datetime.now()})
+            # Store/update user info in Firestore without waiting for it
+            self._profile_writer.submit(self._upsert_profile, user, datetime.now())
 
             return user.uid, user.email, None # Return UID, email, and no error
         except Exception as e:
             return None, None, str(e) # Return no UID, no email, and the error
 
+    def flush(self):
+        """Waits for queued profile writes to finish."""
+        self._profile_writer.submit(lambda: None).result()
+
 # Instantiate the AuthHandler
 auth_manager = AuthHandler()
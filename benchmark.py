@@ -0,0 +1,257 @@
+# benchmark.py
+"""
+End-to-end throughput benchmark. Pushes synthetic recipient workbooks through the same pipeline
+as a campaign (excel_manager ingestion, template personalization, email_manager over SMTP and the
+emailLogs writer) against a local SMTP sink and an in-memory Firestore fake. No real mail is sent
+and nothing is written to Firebase.
+
+    python benchmark.py                       # 1k and 10k rows
+    python benchmark.py --rows 1000 10000 100000 --workers 4 --json bench.json
+
+Reports items/sec, p50/p99 latency and peak RSS for each phase. Latency is per batch for ingest
+and personalize, per message for send, and from enqueue to Firestore commit for log.
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+from openpyxl import Workbook
+
+from email_sender import EmailSender
+from excel_handler import INGEST_BATCH_SIZE, excel_manager
+from fake_firestore import FakeWriteBatch, InMemoryFirestore
+from log_writer import FirestoreLogWriter
+from send_scheduler import SendScheduler
+from smtp_sink import SMTPSink
+from template_engine import template_manager
+
+SUBJECT_TEMPLATE = "Hello {Name}, news from {Company|our team}"
+BODY_TEMPLATE = "Hi {Name},\n\nA quick update for everyone in {City|your city} at {Company|your company}.\n\nBest regards,\nThe Team"
+
+
+def make_workbook(rows):
+    """Builds an .xlsx with Name, Email, Company and City columns, ~1% invalid and ~1% duplicate emails."""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Recipients")
+    sheet.append(["Name", "Email", "Company", "City"])
+    for i in range(rows):
+        if i % 100 == 1:
+            email = f"invalid-address-{i}"
+        elif i % 100 == 2:
+            email = f"user{i - 2}@example.com" # Repeats an earlier row's address
+        else:
+            email = f"user{i}@example.com"
+        sheet.append([f"User {i}", email, f"Company {i % 50}" if i % 7 else None, f"City {i % 20}"])
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+class TimedFirestore(InMemoryFirestore):
+    """The Firestore fake, recording for each log entry the seconds from writer.add() until its batch commit returned."""
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.latencies = []
+
+    def batch(self):
+        return _TimedBatch(self)
+
+
+class _TimedBatch(FakeWriteBatch):
+    def __init__(self, store):
+        super().__init__(store)
+        self._queued = []
+
+    def set(self, reference, data, merge=False):
+        self._queued.append(data.pop('queuedAt'))
+        super().set(reference, data, merge)
+
+    def commit(self):
+        super().commit()
+        committed = time.perf_counter()
+        self._store.latencies.extend(committed - queued for queued in self._queued)
+
+
+def _current_rss():
+    """Resident set size in bytes, from /proc when available (Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Phase:
+    """Times a phase and samples RSS on a background thread to find the phase's peak."""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.count = 0
+        self.peak_rss = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(0.01):
+            self.peak_rss = max(self.peak_rss, _current_rss())
+
+    def __enter__(self):
+        self.peak_rss = _current_rss()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        self._stop.set()
+        self._sampler.join()
+        self.peak_rss = max(self.peak_rss, _current_rss())
+
+    def result(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(round(p / 100 * (len(latencies) - 1))))] * 1000
+
+        return {
+            "phase": self.name,
+            "items": self.count,
+            "seconds": round(self.elapsed, 4),
+            "per_second": round(self.count / self.elapsed, 1) if self.elapsed else None,
+            "p50_ms": percentile(50),
+            "p99_ms": percentile(99),
+            "peak_rss_mb": round(self.peak_rss / (1024 * 1024), 1),
+        }
+
+
+def run_benchmark(rows, workers=1, delay=0.0, firestore_latency=0.0, log_batch_size=100,
+                  ingest_batch_size=INGEST_BATCH_SIZE, render_batch_size=500):
+    """Runs every phase for one workbook size and returns the per-phase results."""
+    workbook = make_workbook(rows)
+    results = []
+
+    # Ingest and personalize work in batches, so their latencies are per batch rather than per message
+    with Phase("ingest") as phase:
+        # Same order as a campaign: templates are checked against the header, then rows are read
+        stream, error = excel_manager.open_recipient_stream(workbook, batch_size=ingest_batch_size)
+        if error:
+            raise RuntimeError(error)
+        templates, error = template_manager.compile_templates(SUBJECT_TEMPLATE, BODY_TEMPLATE, stream.columns)
+        if error:
+            raise RuntimeError(error)
+        stream.fields = templates.columns()
+        recipients = []
+        started = time.perf_counter()
+        for batch in stream.batches():
+            recipients.extend(batch)
+            phase.latencies.append(time.perf_counter() - started)
+            started = time.perf_counter()
+        initial_df, rejects = stream.fields_frame(), stream.rejects
+        phase.count = rows
+    results.append(phase.result())
+
+    with Phase("personalize") as phase:
+        messages = []
+        for start in range(0, len(recipients), render_batch_size):
+            started = time.perf_counter()
+            messages.extend(templates.iter_rendered(recipients[start:start + render_batch_size], initial_df,
+                                                    batch_size=render_batch_size))
+            phase.latencies.append(time.perf_counter() - started)
+        phase.count = len(messages)
+    results.append(phase.result())
+
+    with SMTPSink() as sink:
+        sender = EmailSender(host=sink.host, port=sink.port, use_ssl=False)
+        # A delay of 0 means "as fast as possible"; otherwise one message per `delay` seconds
+        scheduler = SendScheduler(workers=workers, rate=(1.0 / delay) if delay else 1e9,
+                                  burst=1 if delay else max(workers, 1), backend="thread")
+        outcomes = []
+
+        skeleton = sender.prepare_campaign("bench@example.com")
+
+        def send_one(item):
+            recipient, subject, body, _ = item
+            started = time.perf_counter()
+            ok, error = sender.send_email_via_smtp("bench@example.com", "password", recipient['email'], subject, body,
+                                                   skeleton=skeleton)
+            return ok, error, time.perf_counter() - started
+
+        with Phase("send") as phase:
+            scheduler.run(messages, send_one, on_result=lambda i, item, result: outcomes.append(result))
+            phase.latencies = [latency for _, _, latency in outcomes]
+            phase.count = len(outcomes)
+        sender.close()
+        failures = [error for ok, error, _ in outcomes if not ok]
+        if failures:
+            print(f"  {len(failures)} sends failed, first error: {failures[0]}")
+        delivered = sink.messages
+    results.append(phase.result())
+
+    # Log latency runs from writer.add() to the end of the batch commit that wrote the entry
+    firestore = TimedFirestore(latency=firestore_latency)
+    writer = FirestoreLogWriter(client=firestore, batch_size=log_batch_size, flush_interval=0.5,
+                                spill_path=os.devnull)
+    with Phase("log") as phase:
+        writer.start()
+        for (recipient, subject, body, _), (ok, error, _) in zip(messages, outcomes):
+            writer.add({
+                'userId': 'benchmark', 'row': recipient['row'], 'email': recipient['email'],
+                'name': recipient['name'], 'subject': subject, 'body_preview': body[:100],
+                'status': 'sent' if ok else 'failed', 'error': error, 'queuedAt': time.perf_counter(),
+            })
+        writer.close()
+        phase.latencies = firestore.latencies
+        phase.count = writer.written
+    results.append(phase.result())
+
+    return {"rows": rows, "recipients": len(recipients), "rejects": len(rejects),
+            "delivered": delivered, "phases": results}
+
+
+def _print_report(report):
+    print(f"\n{report['rows']} rows: {report['recipients']} recipients, {report['rejects']} rejected, "
+          f"{report['delivered']} delivered to the sink")
+    print(f"  {'phase':<12}{'items':>9}{'seconds':>10}{'items/sec':>12}{'p50 ms':>9}{'p99 ms':>9}{'peak RSS MB':>13}")
+    for r in report["phases"]:
+        p50 = f"{r['p50_ms']:.3f}" if r['p50_ms'] is not None else "-"
+        p99 = f"{r['p99_ms']:.3f}" if r['p99_ms'] is not None else "-"
+        print(f"  {r['phase']:<12}{r['items']:>9}{r['seconds']:>10.3f}{r['per_second'] or 0:>12.1f}{p50:>9}{p99:>9}{r['peak_rss_mb']:>13.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Campaign throughput benchmark against a local SMTP sink and Firestore fake.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000], help="Workbook sizes to run (e.g. 1000 10000 100000).")
+    parser.add_argument("--workers", type=int, default=1, help="Concurrent SMTP workers.")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds between sends (0 = unthrottled).")
+    parser.add_argument("--firestore-latency", type=float, default=0.0, help="Simulated seconds per Firestore batch commit.")
+    parser.add_argument("--log-batch-size", type=int, default=100)
+    parser.add_argument("--ingest-batch-size", type=int, default=INGEST_BATCH_SIZE, help="Rows validated per ingest batch.")
+    parser.add_argument("--render-batch-size", type=int, default=500, help="Recipients personalized per batch.")
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    reports = []
+    for rows in args.rows:
+        report = run_benchmark(rows, args.workers, args.delay, args.firestore_latency, args.log_batch_size,
+                               args.ingest_batch_size, args.render_batch_size)
+        _print_report(report)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+    return reports
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# campaign_history.py
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from firebase_handler import field_filter, get_db
+
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "25"))
+# Seconds a campaign's sent/failed totals are reused before they are counted again
+HISTORY_TOTALS_TTL = float(os.getenv("HISTORY_TOTALS_TTL", "300"))
+
+LOGS_COLLECTION = 'emailLogs'
+STATUS_ICONS = {'sent': '✅ Sent', 'failed': '❌ Failed'}
+
+
+def parse_date(text):
+    """Parses a YYYY-MM-DD filter value. Returns None for an empty value; raises ValueError for a malformed one."""
+    text = (text or "").strip()
+    return datetime.strptime(text, "%Y-%m-%d") if text else None
+
+
+def parse_date_range(start_text, end_text):
+    """(start, end) timestamps for a from/to pair of dates, both days included. Raises ValueError for a malformed date."""
+    start, end = parse_date(start_text), parse_date(end_text)
+    return start, (end + timedelta(days=1) if end is not None else None)
+
+
+def _cell(value):
+    return str(value if value is not None else "").replace('|', '\\|').replace('\n', ' ')
+
+
+class CampaignHistory:
+    """
+    Reads a user's past sends from emailLogs, newest first, one page at a time. Pages are
+    cursor-based (start_after the last document of the previous page), so each page costs
+    `page_size` reads however far back it is. Per-campaign sent/failed totals come from count()
+    aggregation queries and are cached for `totals_ttl` seconds.
+    """
+
+    def __init__(self, client=None, page_size=HISTORY_PAGE_SIZE, totals_ttl=HISTORY_TOTALS_TTL):
+        self.client = client
+        self.page_size = page_size
+        self.totals_ttl = totals_ttl
+        self._totals = {} # (user_id, job_id) -> (time.monotonic() of the count, {'sent', 'failed'})
+        self._lock = threading.Lock()
+
+    def _client(self):
+        client = self.client if self.client is not None else get_db()
+        if client is None:
+            raise RuntimeError("Firestore client is not initialized.")
+        return client
+
+    def page(self, user_id, start=None, end=None, status=None, cursor=None):
+        """
+        Returns (entries, next cursor, error) for one page of the user's logs, filtered by
+        timestamp (start inclusive, end exclusive) and status. Pass the returned cursor back in
+        to get the following page; it is None on the last page.
+        """
+        try:
+            query = self._client().collection(LOGS_COLLECTION).where(filter=field_filter('userId', '==', user_id))
+            if status:
+                query = query.where(filter=field_filter('status', '==', status))
+            if start is not None:
+                query = query.where(filter=field_filter('timestamp', '>=', start))
+            if end is not None:
+                query = query.where(filter=field_filter('timestamp', '<', end))
+            query = query.order_by('timestamp', direction="DESCENDING")
+            if cursor is not None:
+                query = query.start_after(cursor)
+            # One document more than a page tells whether there is a next page without another query
+            docs = list(query.limit(self.page_size + 1).stream())
+        except Exception as e:
+            return [], None, f"Error loading campaign history: {e}"
+        more = len(docs) > self.page_size
+        docs = docs[:self.page_size]
+        return [doc.to_dict() for doc in docs], (docs[-1] if more else None), None
+
+    def _count(self, query, user_id, job_id, status):
+        for filter_ in (field_filter('userId', '==', user_id), field_filter('jobId', '==', job_id),
+                        field_filter('status', '==', status)):
+            query = query.where(filter=filter_)
+        result = query.count(alias="total").get()
+        return int(result[0][0].value)
+
+    def campaign_totals(self, user_id, job_ids):
+        """
+        Returns ({job_id: {'sent', 'failed'}}, error) for the given campaigns. Totals younger than
+        `totals_ttl` are served from the cache; the rest cost two count() aggregations each.
+        """
+        totals, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for job_id in dict.fromkeys(job_ids):
+                cached = self._totals.get((user_id, job_id))
+                if cached is not None and now - cached[0] < self.totals_ttl:
+                    totals[job_id] = cached[1]
+                else:
+                    missing.append(job_id)
+        if not missing:
+            return totals, None
+        try:
+            collection = self._client().collection(LOGS_COLLECTION)
+            counted = {job_id: {status: self._count(collection, user_id, job_id, status) for status in ('sent', 'failed')}
+                       for job_id in missing}
+        except Exception as e:
+            return totals, f"Error counting campaign totals: {e}"
+        with self._lock:
+            for job_id, counts in counted.items():
+                self._totals[(user_id, job_id)] = (now, counts)
+            # Drop expired entries so the cache only holds campaigns viewed recently
+            self._totals = {key: value for key, value in self._totals.items() if now - value[0] < self.totals_ttl}
+        totals.update(counted)
+        return totals, None
+
+    def render_page(self, entries):
+        """Markdown table of a page of log entries."""
+        if not entries:
+            return "No emails found for these filters."
+        lines = ["| Time | Campaign | Sender | Name | Email | Status | Attempts | Error |", "|---|---|---|---|---|---|---|---|"]
+        for entry in entries:
+            timestamp = entry.get('timestamp')
+            shown = timestamp.strftime('%Y-%m-%d %H:%M:%S') if hasattr(timestamp, 'strftime') else _cell(timestamp)
+            lines.append(
+                f"| {shown} | {_cell(entry.get('jobId') or '—')} | {_cell(entry.get('sender'))} | {_cell(entry.get('name'))} | "
+                f"{_cell(entry.get('email'))} | {STATUS_ICONS.get(entry.get('status'), _cell(entry.get('status')))} | "
+                f"{_cell(entry.get('attempts'))} | {_cell(entry.get('error'))} |"
+            )
+        return "\n".join(lines)
+
+    def render_totals(self, totals):
+        """Markdown table of per-campaign totals."""
+        if not totals:
+            return ""
+        lines = ["| Campaign | ✅ Sent | ❌ Failed | Total |", "|---|---|---|---|"]
+        for job_id, counts in totals.items():
+            lines.append(f"| {_cell(job_id)} | {counts['sent']} | {counts['failed']} | {counts['sent'] + counts['failed']} |")
+        return "\n".join(lines)
+
+# Instantiate the CampaignHistory
+campaign_history = CampaignHistory()
@@ -1,28 +1,258 @@
 # email_sender.py
+import binascii
+import os
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import threading
+import uuid
+from email.header import Header
+
+from metrics import (mime_build_seconds, smtp_auth_seconds, smtp_connect_seconds, smtp_data_seconds,
+                     smtp_messages_total, smtp_reconnects_total)
+
+# SMTP server settings. Defaults target Gmail; override them to point at a local test relay.
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+SMTP_USE_SSL = os.getenv("SMTP_USE_SSL", "true").lower() in ("1", "true", "yes")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "false").lower() in ("1", "true", "yes")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+
+
+class MessageSkeleton:
+    """
+    The parts of a campaign's messages that never change, encoded once: the From and MIME headers,
+    the multipart boundary and each body part's headers. render() only encodes the per-recipient
+    To/Subject headers and bodies and joins the pieces into the raw bytes handed to sendmail().
+    Bodies are UTF-8 quoted-printable; with `with_html` every message is multipart/alternative
+    with the plain-text part first and the HTML part second.
+    """
+
+    def __init__(self, sender_email, with_html=False):
+        self.sender_email = sender_email
+        self.with_html = with_html
+        self.boundary = f"==============={uuid.uuid4().hex}=="
+        head = b"From: " + _encode_header(sender_email, "From") + b"\r\nMIME-Version: 1.0\r\n"
+        self._head = head
+        self._text_part = b'Content-Type: text/plain; charset="utf-8"\r\nContent-Transfer-Encoding: quoted-printable\r\n\r\n'
+        self._html_part = b'Content-Type: text/html; charset="utf-8"\r\nContent-Transfer-Encoding: quoted-printable\r\n\r\n'
+        boundary = self.boundary.encode("ascii")
+        self._multipart = b'Content-Type: multipart/alternative; boundary="' + boundary + b'"\r\n\r\n'
+        self._open = b"--" + boundary + b"\r\n"
+        self._between = b"\r\n--" + boundary + b"\r\n"
+        self._close = b"\r\n--" + boundary + b"--\r\n"
+
+    def render(self, recipient_email, subject, body, html_body=None):
+        """Returns the complete message for one recipient as CRLF-terminated bytes."""
+        headers = [self._head, b"To: ", _encode_header(recipient_email, "To"),
+                   b"\r\nSubject: ", _encode_header(subject, "Subject"), b"\r\n"]
+        if not self.with_html:
+            return b"".join(headers + [self._text_part, _encode_body(body)])
+        return b"".join(headers + [self._multipart, self._open, self._text_part, _encode_body(body),
+                                   self._between, self._html_part, _encode_body(html_body or ""), self._close])
+
+
+def _encode_header(value, name):
+    # Line breaks in personalized values would otherwise start new headers
+    value = str(value or "").replace("\r", " ").replace("\n", " ")
+    if value.isascii() and len(value) < 900:
+        return value.encode("ascii")
+    return Header(value, "utf-8", header_name=name).encode(linesep="\r\n").encode("ascii")
+
+
+def _encode_body(text):
+    # SMTP needs CRLF line endings; quoted-printable keeps lines short and the message 7-bit clean
+    text = str(text or "").replace("\r\n", "\n").replace("\r", "\n").replace("\n", "\r\n")
+    return binascii.b2a_qp(text.encode("utf-8"), istext=True)
+
+
+def classify_smtp_error(error, recipient_email=None):
+    """
+    Returns (reply code or None, transient, bounce) for a failed send. 4xx replies (421 service
+    not available, 450/451/452 mailbox busy, local error, storage) and network failures such as a
+    dropped connection or a timeout are transient and worth retrying later; 5xx replies and
+    anything else are permanent. `bounce` is only set when the server permanently refused the
+    recipient itself at RCPT: a failed login (535) or a refused sender (e.g. a daily sending
+    limit at MAIL FROM) is permanent for this send but says nothing about the address.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        refused = error.recipients.get(recipient_email) or next(iter(error.recipients.values()), None)
+        code = refused[0] if refused else None
+        permanent = isinstance(code, int) and 500 <= code < 600
+        return code, isinstance(code, int) and 400 <= code < 500, permanent
+    if isinstance(error, smtplib.SMTPResponseException):
+        code = error.smtp_code
+        return code, isinstance(code, int) and 400 <= code < 500, False
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return None, True, False
+    if isinstance(error, smtplib.SMTPException):
+        return None, False, False # e.g. an extension the server doesn't support
+    if isinstance(error, OSError):
+        return None, True, False # Connection refused or reset, DNS failure, socket timeout
+    return None, False, False
+
+
+class PooledConnection:
+    """An authenticated SMTP session plus the number of messages sent over it."""
+
+    def __init__(self, smtp, key):
+        self.smtp = smtp
+        self.key = key
+        self.messages_sent = 0
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except Exception:
+            # The server may already have dropped the connection; just release the socket.
+            try:
+                self.smtp.close()
+            except Exception:
+                pass
+
+
+class SMTPConnectionPool:
+    """
+    Keeps authenticated SMTP sessions open across a campaign, keyed by sender credentials.
+    A session is recycled after `max_messages_per_connection` messages, and a connection that
+    the server has dropped is discarded instead of being returned to the pool.
+    """
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, use_ssl=SMTP_USE_SSL, starttls=SMTP_STARTTLS,
+                 timeout=SMTP_TIMEOUT, max_messages_per_connection=SMTP_MAX_MESSAGES_PER_CONNECTION,
+                 max_idle_per_sender=SMTP_POOL_SIZE):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.starttls = starttls
+        self.timeout = timeout
+        self.max_messages_per_connection = max_messages_per_connection
+        self.max_idle_per_sender = max_idle_per_sender
+        self._idle = {} # (sender_email, app_password) -> list of idle PooledConnection
+        self._lock = threading.Lock()
+
+    def _connect(self, sender_email, app_password):
+        with smtp_connect_seconds.time():
+            if self.use_ssl:
+                smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+            else:
+                smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+                if self.starttls:
+                    smtp.starttls()
+        try:
+            if app_password:
+                with smtp_auth_seconds.time():
+                    smtp.login(sender_email, app_password)
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+
+    def acquire(self, sender_email, app_password):
+        """Returns an idle authenticated connection for the sender, or opens a new one."""
+        key = (sender_email, app_password)
+        with self._lock:
+            idle = self._idle.get(key)
+            conn = idle.pop() if idle else None
+        if conn is not None:
+            return conn
+        return PooledConnection(self._connect(sender_email, app_password), key)
+
+    def release(self, conn, broken=False):
+        """Returns a connection to the pool, or closes it if it is broken or has reached its message limit."""
+        if broken or conn.messages_sent >= self.max_messages_per_connection:
+            conn.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault(conn.key, [])
+            if len(idle) < self.max_idle_per_sender:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        """Closes every idle connection. Call this when a campaign ends."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
 
 class EmailSender:
-    def send_email_via_smtp(self, sender_email, app_password, recipient_email, subject, body):
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, use_ssl=SMTP_USE_SSL, starttls=SMTP_STARTTLS,
+                 timeout=SMTP_TIMEOUT, pooled=True, max_messages_per_connection=SMTP_MAX_MESSAGES_PER_CONNECTION,
+                 pool_size=SMTP_POOL_SIZE):
+        self.pooled = pooled
+        self.pool = SMTPConnectionPool(host, port, use_ssl, starttls, timeout,
+                                       max_messages_per_connection, pool_size)
+
+    def prepare_campaign(self, sender_email, with_html=False):
+        """Builds the message skeleton shared by every email of a campaign. Pass it to send_email_via_smtp."""
+        return MessageSkeleton(sender_email, with_html)
+
+    def send_email_via_smtp(self, sender_email, app_password, recipient_email, subject, body, html_body=None, skeleton=None):
         """
-        Sends a single email using Gmail SMTP_SSL.
+        Sends a single email over SMTP (Gmail SMTP_SSL by default).
         Requires an App Password for Gmail if 2FA is enabled.
+        The message is rendered from `skeleton` (see prepare_campaign; one is built on the fly if
+        omitted) and sent as raw bytes. `html_body` adds an HTML alternative to the plain text.
+        In pooled mode the authenticated session is reused for later sends; if the server has
+        dropped it, the message is retried once on a fresh connection.
+        Returns (success, message); use deliver() to also get the reply code and whether a failure is transient.
+        """
+        success, message, _, _, _ = self.deliver(sender_email, app_password, recipient_email, subject, body, html_body, skeleton)
+        return success, message
+
+    def deliver(self, sender_email, app_password, recipient_email, subject, body, html_body=None, skeleton=None):
+        """
+        Like send_email_via_smtp(), but returns (success, message, reply code or None, transient, bounce),
+        where `transient` tells whether a failure is worth retrying and `bounce` whether the recipient
+        address was refused for good (see classify_smtp_error).
         """
         try:
-            msg = MIMEMultipart()
-            msg['From'] = sender_email
-            msg['To'] = recipient_email
-            msg['Subject'] = subject
+            with mime_build_seconds.time():
+                if skeleton is None:
+                    skeleton = MessageSkeleton(sender_email, with_html=html_body is not None)
+                msg = skeleton.render(recipient_email, subject, body, html_body)
 
-            msg.attach(MIMEText(body, 'plain'))
+            if not self.pooled:
+                with self.pool._connect(sender_email, app_password) as smtp:
+                    with smtp_data_seconds.time():
+                        smtp.sendmail(sender_email, [recipient_email], msg)
+                smtp_messages_total.inc(result="sent")
+                return True, "Email sent successfully.", 250, False, False
 
-            with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp:
-                smtp.login(sender_email, app_password)
-                smtp.send_message(msg)
-            return True, "Email sent successfully."
+            for attempt in range(2):
+                conn = self.pool.acquire(sender_email, app_password)
+                try:
+                    with smtp_data_seconds.time():
+                        conn.smtp.sendmail(sender_email, [recipient_email], msg)
+                except smtplib.SMTPServerDisconnected:
+                    self.pool.release(conn, broken=True)
+                    if attempt == 1:
+                        raise
+                    smtp_reconnects_total.inc()
+                    continue # Reconnect transparently and try once more
+                except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                    # The server rejected this message but the session is still usable.
+                    self.pool.release(conn)
+                    raise
+                except Exception:
+                    self.pool.release(conn, broken=True)
+                    raise
+                conn.messages_sent += 1
+                self.pool.release(conn)
+                smtp_messages_total.inc(result="sent")
+                return True, "Email sent successfully.", 250, False, False
         except Exception as e:
-            return False, str(e)
+            code, transient, bounce = classify_smtp_error(e, recipient_email)
+            smtp_messages_total.inc(result="deferred" if transient else "failed")
+            return False, str(e) or type(e).__name__, code, transient, bounce
+
+    def close(self):
+        """Closes any pooled SMTP sessions."""
+        self.pool.close_all()
 
 # Instantiate the EmailSender
 email_manager = EmailSender()
@@ -1,68 +1,335 @@
 # excel_handler.py
-import pandas as pd
 import io
+import csv
+import os
+import threading
+from itertools import islice
+
+from metrics import excel_parse_seconds, excel_rows_total
+
+# Rows are normalized and validated this many at a time.
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "5000"))
+
+# Deliberately simple syntax check, applied after trimming and lowercasing.
+EMAIL_PATTERN = r"^[a-z0-9.!#$%&'*+/=?^_`{|}~-]+@[a-z0-9](?:[a-z0-9-]*[a-z0-9])?(?:\.[a-z0-9](?:[a-z0-9-]*[a-z0-9])?)+$"
+
+REQUIRED_COLUMNS = ['Name', 'Email']
+
+# Per-job CSV sidecars and final reports are written here.
+RESULTS_DIR = os.getenv("RESULTS_DIR", "results")
+RESULT_COLUMNS = ['row', 'name', 'email', 'status', 'error', 'timestamp', 'attempts', 'code']
+STATUS_LABELS = {'sent': '✅ Sent', 'failed': '❌ Failed', 'rejected': '⚠️ Skipped', 'deferred': '⏳ Retry Pending'}
+
+
+class RecipientStream:
+    """
+    Lazily yields recipients from spreadsheet rows, `batch_size` rows at a time.
+    Each batch is trimmed, lowercased, syntax-checked and de-duplicated with vectorized pandas
+    operations. Accepted recipients are yielded as {'row', 'name', 'email'} dicts, where `row` is the
+    0-based index of the data row in the upload; rejected rows are collected in `rejects` as
+    {'row', 'name', 'email', 'reason'} while the stream is consumed. The values of the columns named
+    in `fields` (every column by default), for template placeholders, are collected column by column
+    rather than per recipient; fields_frame() returns them.
+    """
+
+    def __init__(self, columns, rows, batch_size=INGEST_BATCH_SIZE, on_close=None, fields=None):
+        self.columns = columns
+        self.rows = rows
+        self.batch_size = batch_size
+        self.fields = fields
+        self.rejects = []
+        self._on_close = on_close
+        self._seen = set()
+        self._field_rows = []
+        self._field_values = {} # column -> values of the accepted rows, in the order of _field_rows
+
+    def __iter__(self):
+        for batch in self.batches():
+            yield from batch
+
+    def batches(self):
+        """Yields the accepted recipients one batch of `batch_size` rows at a time."""
+        try:
+            row_offset = 0
+            while True:
+                with excel_parse_seconds.time(step="read"):
+                    batch = list(islice(self.rows, self.batch_size))
+                if not batch:
+                    break
+                rejected_before = len(self.rejects)
+                with excel_parse_seconds.time(step="validate"):
+                    accepted = self._process_batch(batch, row_offset)
+                excel_rows_total.inc(len(accepted), outcome="accepted")
+                excel_rows_total.inc(len(self.rejects) - rejected_before, outcome="rejected")
+                yield accepted
+                row_offset += len(batch)
+        finally:
+            self.close()
+
+    def fields_frame(self):
+        """
+        A DataFrame of the accepted rows read so far, indexed by original row, with the cleaned Name and
+        Email and the `fields` columns. Object columns keep each cell as read (no float conversion).
+        """
+        import pandas as pd
+        return pd.DataFrame({column: pd.Series(values, dtype=object) for column, values in self._field_values.items()},
+                            index=pd.Index(self._field_rows, name='row'))
+
+    def close(self):
+        if self._on_close:
+            self._on_close()
+            self._on_close = None
+
+    def _process_batch(self, batch, row_offset):
+        import pandas as pd # Deferred so importing this module stays cheap; a no-op after the first batch
+        width = len(self.columns)
+        # Pad or trim ragged rows so they line up with the header
+        batch = [tuple(row[:width]) + (None,) * (width - len(row)) for row in batch]
+        df = pd.DataFrame.from_records(batch, columns=self.columns)
+        df.index = pd.RangeIndex(row_offset, row_offset + len(df))
+
+        names = df['Name'].fillna('').astype(str).str.strip()
+        raw_emails = df['Email'].fillna('').astype(str).str.strip()
+
+        # Skip rows with neither a name nor an email (trailing blank rows are common in .xlsx files)
+        keep = (names != '') | (raw_emails != '')
+        if not keep.all():
+            df, names, raw_emails = df[keep], names[keep], raw_emails[keep]
+        if df.empty:
+            return []
+        emails = raw_emails.str.lower()
+
+        valid = emails.str.match(EMAIL_PATTERN)
+        # Membership in earlier batches is a set lookup, so cost stays proportional to the batch
+        seen_before = emails.map(self._seen.__contains__).astype(bool)
+        duplicate = valid & (emails.duplicated() | seen_before)
+        accepted = valid & ~duplicate
+
+        for reason, mask in (("invalid email", ~valid), ("duplicate email", duplicate)):
+            if mask.any():
+                self.rejects.extend(
+                    {'row': int(row), 'name': name, 'email': email, 'reason': reason}
+                    for row, name, email in zip(df.index[mask], names[mask], raw_emails[mask])
+                )
+
+        accepted_emails = emails[accepted]
+        self._seen.update(accepted_emails)
+
+        rows = [int(row) for row in df.index[accepted]]
+        recipients = [{'row': row, 'name': name, 'email': email}
+                      for row, name, email in zip(rows, names[accepted], accepted_emails)]
+
+        # The selected columns are kept for templates, with the cleaned Name and Email. Values come from the
+        # raw cells, not the DataFrame, whose dtype inference turns an integer column with blanks into floats.
+        self._field_rows.extend(rows)
+        self._field_values.setdefault('Name', []).extend(r['name'] for r in recipients)
+        self._field_values.setdefault('Email', []).extend(r['email'] for r in recipients)
+        for i, column in enumerate(self.columns):
+            if column not in REQUIRED_COLUMNS and (self.fields is None or column in self.fields):
+                self._field_values.setdefault(column, []).extend(batch[row - row_offset][i] for row in rows)
+        return recipients
+
 
 class ExcelHandler:
-    def process_excel_for_sending(self, excel_file_bytes):
+    def _read_source(self, source, filename=None):
         """
-        Reads an Excel file from bytes, expects 'Name' and 'Email' columns.
-        Returns a pandas DataFrame and a list of dictionaries with 'name' and 'email'.
+        Returns (header, row_iterator, close_fn) for an .xlsx or .csv upload.
+        `source` is the uploaded bytes or a file path; CSV is detected from the file name,
+        or otherwise because the content is not a zip archive like .xlsx files are.
         """
+        if isinstance(source, (str, os.PathLike)):
+            filename = filename or str(source)
+            with open(source, 'rb') as f:
+                source = f.read()
+
+        is_csv = filename.lower().endswith('.csv') if filename else not source[:2] == b'PK'
+        if is_csv:
+            text = io.TextIOWrapper(io.BytesIO(source), encoding='utf-8-sig', newline='')
+            reader = csv.reader(text)
+            header = next(reader, [])
+            return header, reader, text.close
+
+        # Read-only mode streams rows from the sheet instead of loading the whole workbook
+        from openpyxl import load_workbook
+        workbook = load_workbook(io.BytesIO(source), read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, ())
+        return header, rows, workbook.close
+
+    def _column_names(self, header):
+        """Names blank header cells and suffixes repeated ones, the way pandas does ('Unnamed: 2', 'City.1')."""
+        columns = []
+        counts = {}
+        for i, col in enumerate(header):
+            name = str(col).strip() if col is not None and str(col).strip() else f"Unnamed: {i}"
+            if name in counts:
+                counts[name] += 1
+                name = f"{name}.{counts[name]}"
+            else:
+                counts[name] = 0
+            columns.append(name)
+        return columns
+
+    def open_recipient_stream(self, source, filename=None, batch_size=INGEST_BATCH_SIZE):
+        """
+        Opens an .xlsx or .csv upload for streaming. Expects 'Name' and 'Email' columns.
+        Only the header has been read when this returns, so templates can be checked against
+        `stream.columns` before any rows are.
+        Returns a RecipientStream and no error, or None and an error message.
+        """
+        close = None
         try:
-            # Read Excel file from BytesIO object provided by Gradio
-            df = pd.read_excel(io.BytesIO(excel_file_bytes))
-            required_columns = ['Name', 'Email']
-            if not all(col in df.columns for col in required_columns):
-                raise ValueError("Excel file must contain 'Name' and 'Email' columns.")
-
-            recipients = []
-            for index, row in df.iterrows():
-                recipients.append({
-                    'name': str(row['Name']).strip(),
-                    'email': str(row['Email']).strip()
-                })
-            return df, recipients, None # Return original DataFrame, recipients list, and no error
+            with excel_parse_seconds.time(step="open"):
+                header, rows, close = self._read_source(source, filename)
+            columns = self._column_names(header)
+            if not all(col in columns for col in REQUIRED_COLUMNS):
+                raise ValueError("File must contain 'Name' and 'Email' columns.")
+            return RecipientStream(columns, rows, batch_size, on_close=close), None
         except Exception as e:
-            return None, None, f"Error processing Excel file: {e}"
+            if close:
+                close()
+            return None, f"Error processing Excel file: {e}"
 
-    def generate_final_excel(self, initial_df, log_data):
+    def read_recipients(self, stream, fields=None):
         """
-        Generates a new Excel file with send statuses merged with the initial DataFrame.
-        `initial_df` is the pandas DataFrame loaded from the user's initial upload.
-        `log_data` is a list of dictionaries with log entries.
+        Consumes an open RecipientStream, keeping only the columns in `fields` (e.g. the templates'
+        placeholders; every column if None) besides Name and Email.
+        Returns a DataFrame of the accepted recipients' Name, Email and `fields` columns indexed by
+        original row (used to render templates and for the final report), the list of recipient
+        dicts with 'row', 'name' and 'email', the list of rejected rows, and an error message.
         """
         try:
-            if not log_data:
-                # If no logs, just return the original DataFrame with empty status columns
-                initial_df['Status'] = 'Not Processed'
-                initial_df['Error Details'] = ''
-                initial_df['Sent Timestamp'] = ''
-                final_df = initial_df[['Name', 'Email', 'Status', 'Error Details', 'Sent Timestamp']]
-            else:
-                log_df = pd.DataFrame(log_data)
+            stream.fields = fields
+            recipients = list(stream)
+            return stream.fields_frame(), recipients, stream.rejects, None # Accepted DataFrame, recipients, rejects, and no error
+        except Exception as e:
+            stream.close()
+            return None, None, None, f"Error processing Excel file: {e}"
 
-                # Ensure 'email' column is string type for merging
-                initial_df['Email'] = initial_df['Email'].astype(str)
-                log_df['email'] = log_df['email'].astype(str)
+    def generate_final_excel(self, initial_df, log_data, rejects=None):
+        """
+        Generates a new Excel file with send statuses joined to the initial DataFrame by original row index.
+        `initial_df` is the DataFrame returned by read_recipients (indexed by row).
+        `log_data` is a list of dictionaries (or a DataFrame) of results with 'row', 'status', 'error' and 'timestamp',
+        and optionally 'attempts' and 'code' (the last SMTP reply code).
+        `rejects` are the rows skipped during ingestion; they are listed with their rejection reason.
+        """
+        import pandas as pd
+        try:
+            base_df = initial_df[['Name', 'Email']]
+            log_df = pd.DataFrame(log_data, columns=RESULT_COLUMNS) if not isinstance(log_data, pd.DataFrame) else log_data
+            # A row can be reported more than once (e.g. a resumed job); its latest outcome wins
+            log_df = log_df.drop_duplicates('row', keep='last').set_index('row')
+            log_df = log_df.reindex(columns=['status', 'error', 'timestamp', 'attempts', 'code']) # Older sidecars lack the last two
 
-                # Merge the original DataFrame with the log data based on email
-                merged_df = pd.merge(initial_df, log_df[['email', 'status', 'error', 'timestamp']],
-                                     left_on='Email', right_on='email', how='left')
+            if rejects:
+                rejects_df = pd.DataFrame(rejects).set_index('row')
+                rejects_df = rejects_df.rename(columns={'name': 'Name', 'email': 'Email', 'reason': 'error'})
+                rejects_df['status'] = 'rejected'
+                base_df = pd.concat([base_df, rejects_df.loc[~rejects_df.index.isin(base_df.index), ['Name', 'Email']]])
+                # A recorded outcome always wins over a rejection, so each row is listed once
+                rejects_df = rejects_df[~rejects_df.index.isin(log_df.index)]
+                log_df = pd.concat([log_df, rejects_df[['status', 'error']]])
 
-                # Clean up merged columns and rename for clarity
-                merged_df['Status'] = merged_df['status'].fillna('Not Sent').apply(lambda x: '✅ Sent' if x == 'sent' else ('❌ Failed' if x == 'failed' else x))
-                merged_df['Error Details'] = merged_df['error'].fillna('')
-                merged_df['Sent Timestamp'] = merged_df['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S').fillna('')
+            final_df = base_df.join(log_df, how='left').sort_index()
 
-                final_df = merged_df[['Name', 'Email', 'Status', 'Error Details', 'Sent Timestamp']]
+            # Vectorized status formatting
+            status = final_df['status'].astype(object).where(final_df['status'].notna(), 'Not Sent')
+            final_df['Status'] = status.replace(STATUS_LABELS)
+            final_df['Error Details'] = final_df['error'].fillna('')
+            final_df['Sent Timestamp'] = pd.to_datetime(final_df['timestamp'], errors='coerce').dt.strftime('%Y-%m-%d %H:%M:%S').fillna('')
+            final_df['Attempts'] = final_df['attempts'].fillna('')
+            final_df['Last Response Code'] = final_df['code'].fillna('')
+            final_df = final_df[['Name', 'Email', 'Status', 'Error Details', 'Sent Timestamp', 'Attempts', 'Last Response Code']]
 
+            # A write-only workbook streams rows to the file instead of building every cell in memory
+            from openpyxl import Workbook
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet('Email Results')
+            sheet.append(list(final_df.columns))
+            for row in final_df.itertuples(index=False, name=None):
+                sheet.append(row)
             output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                final_df.to_excel(writer, index=False, sheet_name='Email Results')
+            workbook.save(output)
             output.seek(0)
             return output, None
         except Exception as e:
             return None, f"Error generating final Excel: {e}"
 
+
+def save_source(job_id, data, directory=RESULTS_DIR):
+    """Keeps a copy of the uploaded recipient file next to the job's results. Returns its path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{job_id}_source")
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+class ResultsWriter:
+    """
+    Appends each send outcome to a CSV sidecar as soon as it completes, keyed by the recipient's
+    original row index. The sidecar is flushed per row, so a partial report is available at any
+    point (and survives the process dying) without rebuilding anything.
+    """
+
+    def __init__(self, job_id, directory=RESULTS_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.job_id = job_id
+        self.path = os.path.join(directory, f"{job_id}_results.csv")
+        is_new = not os.path.exists(self.path)
+        self.columns = RESULT_COLUMNS
+        if not is_new:
+            # A sidecar started by an older version keeps its own header; rows are written to match it
+            with open(self.path, newline='', encoding='utf-8') as f:
+                self.columns = next(csv.reader(f), None) or RESULT_COLUMNS
+        self._file = open(self.path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._lock = threading.Lock()
+        if is_new:
+            self._writer.writerow(RESULT_COLUMNS)
+            self._file.flush()
+
+    def record(self, row, name, email, status, error, timestamp, attempts=None, code=None):
+        values = {'row': row, 'name': name, 'email': email, 'status': status, 'error': error or '',
+                  'timestamp': timestamp.isoformat() if hasattr(timestamp, 'isoformat') else timestamp,
+                  'attempts': '' if attempts is None else attempts, 'code': '' if code is None else code}
+        with self._lock:
+            self._writer.writerow([values.get(column, '') for column in self.columns])
+            self._file.flush()
+
+    def _flush(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def partial_report_path(self):
+        """Path of the CSV sidecar with every outcome recorded so far."""
+        self._flush()
+        return self.path
+
+    def read_results(self):
+        """Loads the recorded outcomes as a DataFrame."""
+        import pandas as pd
+        self._flush()
+        results = pd.read_csv(self.path, dtype=str, keep_default_na=False)
+        results['row'] = results['row'].astype(int)
+        return results
+
+    def write_final_report(self, initial_df, rejects=None):
+        """Writes the final .xlsx next to the sidecar. Returns its path and no error, or None and an error."""
+        output, error = excel_manager.generate_final_excel(initial_df, self.read_results(), rejects)
+        if error:
+            return None, error
+        path = os.path.join(os.path.dirname(self.path), f"{self.job_id}_results.xlsx")
+        with open(path, 'wb') as f:
+            f.write(output.getvalue())
+        return path, None
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
 # Instantiate the ExcelHandler
 excel_manager = ExcelHandler()
@@ -0,0 +1,50 @@
+# fake_auth.py
+"""
+A small in-memory stand-in for firebase_admin.auth, covering get_user_by_email.
+Pass it to AuthHandler(auth=InMemoryAuth(...)) to exercise or benchmark logins locally.
+"""
+import threading
+import time
+import uuid
+
+
+class UserNotFoundError(Exception):
+    pass
+
+
+class FakeUserMetadata:
+    def __init__(self, creation_timestamp):
+        self.creation_timestamp = creation_timestamp # milliseconds since the epoch, like the Admin SDK
+
+
+class FakeUserRecord:
+    def __init__(self, email, display_name=None, uid=None, disabled=False):
+        self.uid = uid or uuid.uuid4().hex[:28]
+        self.email = email
+        self.display_name = display_name
+        self.disabled = disabled
+        self.user_metadata = FakeUserMetadata(int(time.time() * 1000))
+
+
+class InMemoryAuth:
+    def __init__(self, latency=0.0):
+        self.latency = latency # Seconds added to each lookup to mimic a remote call
+        self.lookups = 0
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def create_user(self, email, display_name=None, uid=None, disabled=False):
+        user = FakeUserRecord(email, display_name, uid, disabled)
+        with self._lock:
+            self._users[email.lower()] = user
+        return user
+
+    def get_user_by_email(self, email):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.lookups += 1
+            user = self._users.get(email.lower())
+        if user is None:
+            raise UserNotFoundError(f"No user record found for the provided email: {email}.")
+        return user
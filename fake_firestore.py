@@ -0,0 +1,244 @@
+# fake_firestore.py
+"""
+A small in-memory stand-in for the Firestore client, covering the calls this app makes
+(collection/document reads and writes, write batches, and simple queries with where/order_by/
+limit/start_after and count() aggregations). Install it with
+firebase_handler.use_firestore_client(InMemoryFirestore()) for tests and benchmarks.
+"""
+import copy
+import operator
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from firebase_handler import not_found_error, server_timestamp
+
+
+def _resolve(data):
+    # Fills in server timestamps the way Firestore does at commit
+    sentinel = server_timestamp()
+    return {key: (datetime.now() if value is sentinel else value) for key, value in data.items()}
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class FakeDocumentReference:
+    def __init__(self, store, collection_name, doc_id):
+        self._store = store
+        self.collection_name = collection_name
+        self.id = doc_id
+
+    def get(self):
+        with self._store.lock:
+            data = self._store.collections.get(self.collection_name, {}).get(self.id)
+            return FakeDocumentSnapshot(self, copy.deepcopy(data) if data is not None else None)
+
+    def set(self, data, merge=False):
+        with self._store.lock:
+            docs = self._store.collections.setdefault(self.collection_name, {})
+            if merge and self.id in docs:
+                docs[self.id].update(copy.deepcopy(_resolve(data)))
+            else:
+                docs[self.id] = copy.deepcopy(_resolve(data))
+
+    def create(self, data):
+        with self._store.lock:
+            docs = self._store.collections.setdefault(self.collection_name, {})
+            if self.id in docs:
+                raise KeyError(f"Document already exists: {self.collection_name}/{self.id}")
+            docs[self.id] = copy.deepcopy(_resolve(data))
+
+    def update(self, data):
+        with self._store.lock:
+            docs = self._store.collections.setdefault(self.collection_name, {})
+            if self.id not in docs:
+                raise not_found_error()(f"No document to update: {self.collection_name}/{self.id}")
+            docs[self.id].update(copy.deepcopy(_resolve(data)))
+
+    def delete(self):
+        with self._store.lock:
+            self._store.collections.get(self.collection_name, {}).pop(self.id, None)
+
+
+_OPERATORS = {
+    "==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+    "in": lambda field, values: field in values,
+    "not-in": lambda field, values: field not in values,
+    "array_contains": lambda field, value: isinstance(field, list) and value in field,
+}
+
+
+class FakeQuery:
+    """An immutable query over one collection, evaluated in memory when streamed."""
+
+    def __init__(self, store, name, filters=(), orders=(), limit=None, cursor=None):
+        self._store = store
+        self.name = name
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        fields = dict(filters=self._filters, orders=self._orders, limit=self._limit, cursor=self._cursor)
+        fields.update(changes)
+        return FakeQuery(self._store, self.name, **fields)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None: # A FieldFilter (google.cloud.firestore_v1) or anything with the same attributes
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if op_string not in _OPERATORS:
+            raise ValueError(f"Unsupported operator: {op_string}")
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction == "DESCENDING"),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        # A snapshot or a {field: value} dict of the order_by fields; both support .get(field).
+        # A snapshot also pins the document ID, which Firestore implicitly orders by last.
+        values = tuple(document_fields_or_snapshot.get(field) for field, _ in self._orders)
+        return self._copy(cursor=(values, getattr(document_fields_or_snapshot, "id", None)))
+
+    def count(self, alias=None):
+        return FakeAggregationQuery(self, alias or "count")
+
+    def _matches(self, data):
+        for field, op, value in self._filters:
+            if field not in data or not _OPERATORS[op](data[field], value):
+                return False
+        return True
+
+    def _results(self):
+        with self._store.lock:
+            docs = [(doc_id, copy.deepcopy(data)) for doc_id, data in self._store.collections.get(self.name, {}).items()
+                    if self._matches(data)]
+        # Stable sorts, last key first, give a multi-field ordering; documents without the field are excluded like in Firestore.
+        # Ties are broken by document ID, in the direction of the last order_by.
+        docs.sort(key=lambda d: d[0], reverse=bool(self._orders) and self._orders[-1][1])
+        for field, descending in reversed(self._orders):
+            docs = [d for d in docs if field in d[1]]
+            docs.sort(key=lambda d: d[1][field], reverse=descending)
+        if self._cursor is not None:
+            docs = [d for d in docs if self._after_cursor(*d)]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        return docs
+
+    def _after_cursor(self, doc_id, data):
+        values, cursor_id = self._cursor
+        for (field, descending), cursor_value in zip(self._orders, values):
+            value = data.get(field)
+            if value == cursor_value:
+                continue
+            return value < cursor_value if descending else value > cursor_value
+        if cursor_id is None:
+            return False # Equal on every ordered field and no document to tell them apart: skipped
+        descending = bool(self._orders) and self._orders[-1][1]
+        return doc_id < cursor_id if descending else doc_id > cursor_id
+
+    def stream(self):
+        for doc_id, data in self._results():
+            yield FakeDocumentSnapshot(FakeDocumentReference(self._store, self.name, doc_id), data)
+
+    def get(self):
+        return list(self.stream())
+
+
+class FakeAggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class FakeAggregationQuery:
+    """query.count(): get() returns [[result]] like the SDK's AggregationQuery."""
+
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias
+
+    def get(self):
+        return [[FakeAggregationResult(self._alias, len(self._query._results()))]]
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, store, name):
+        super().__init__(store, name)
+
+    def document(self, doc_id=None):
+        return FakeDocumentReference(self._store, self.name, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+
+
+class FakeWriteBatch:
+    """Collects writes and applies them together on commit(), like a Firestore WriteBatch."""
+
+    def __init__(self, store):
+        self._store = store
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def set(self, reference, data, merge=False):
+        self._writes.append(lambda: reference.set(data, merge=merge))
+
+    def create(self, reference, data):
+        self._writes.append(lambda: reference.create(data))
+
+    def update(self, reference, data):
+        self._writes.append(lambda: reference.update(data))
+
+    def delete(self, reference):
+        self._writes.append(reference.delete)
+
+    def commit(self):
+        if self._store.latency:
+            time.sleep(self._store.latency)
+        if self._store.fail_commits:
+            raise RuntimeError("Simulated Firestore commit failure.")
+        with self._store.lock:
+            for write in self._writes:
+                write()
+        self._store.commits += 1
+        self._writes = []
+
+
+class InMemoryFirestore:
+    def __init__(self, latency=0.0):
+        self.collections = {} # collection name -> {doc_id: data}
+        self.lock = threading.RLock()
+        self.commits = 0
+        self.latency = latency # Seconds added to each batch commit to mimic a remote round-trip
+        self.fail_commits = False # Set to True to simulate an unavailable backend
+
+    def collection(self, name):
+        return FakeCollectionReference(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
@@ -1,8 +1,15 @@
 # firebase_handler.py
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
 import os
 import json # To parse JSON string from environment variable if used
+import threading
+
+# The Admin SDK (and the gRPC stack behind firestore) is imported and initialized on first use,
+# not at import time, so modules that only need the accessors start quickly.
+_init_lock = threading.Lock()
+_initialized = False # True once initialization has been attempted
+_init_error = None # Why initialization failed, if it did
+_db = None
+_auth = None
 
 def initialize_firebase():
     """
@@ -13,6 +20,9 @@ def initialize_firebase():
     3. serviceAccountKey.json file (for local development/testing).
     """
     try:
+        import firebase_admin
+        from firebase_admin import credentials
+
         if not firebase_admin._apps: # Check if Firebase app is already initialized
             cred = None
             if os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
@@ -34,16 +44,120 @@ def initialize_firebase():
                 'projectId': os.getenv('FIREBASE_PROJECT_ID') # Get project ID from env
             })
             print("Firebase Admin SDK initialized successfully.")
-        return True
+        return True, None
     except Exception as e:
         print(f"Error initializing Firebase Admin SDK: {e}")
-        return False
-
-# Initialize Firebase when this module is imported
-if initialize_firebase():
-    db = firestore.client()
-    auth_client = auth
-else:
-    db = None
-    auth_client = None
-    print("Firestore and Auth clients not available due to Firebase initialization error.")
+        return False, str(e)
+
+def ensure_initialized():
+    """
+    Initializes Firebase and creates the Firestore and Auth clients on the first call; later calls
+    return immediately. Safe to call from several threads. Returns (ready, error).
+    """
+    global _initialized, _init_error, _db, _auth
+    if _initialized: # Fast path, no lock once initialization has been attempted
+        return _init_error is None, _init_error
+    with _init_lock:
+        if not _initialized:
+            ok, error = initialize_firebase()
+            if ok:
+                try:
+                    from firebase_admin import firestore, auth
+                    _db = firestore.client()
+                    _auth = auth
+                except Exception as e:
+                    ok, error = False, str(e)
+            if not ok:
+                _init_error = error or "Firebase initialization failed."
+                print("Firestore and Auth clients not available due to Firebase initialization error.")
+            _initialized = True
+    return _init_error is None, _init_error
+
+def credentials_configured():
+    """Whether some Firebase credential source is present, without importing or initializing the SDK."""
+    return bool(os.getenv('GOOGLE_APPLICATION_CREDENTIALS') or os.getenv('FIREBASE_SERVICE_ACCOUNT_KEY')
+                or os.path.exists("serviceAccountKey.json"))
+
+def init_status():
+    """Returns (initialized, error) without triggering initialization."""
+    return _initialized, _init_error
+
+_db_override = None # Set by use_firestore_client() to substitute a fake (see fake_firestore.py)
+_auth_override = None # Set by use_auth_client() to substitute a fake (see fake_auth.py)
+
+def get_db():
+    """
+    Returns the Firestore client in use: the override if one is set, otherwise the Admin SDK client
+    (initialized on first call). Returns None if Firebase could not be initialized.
+    """
+    if _db_override is not None:
+        return _db_override
+    ensure_initialized()
+    return _db
+
+def get_auth():
+    """Returns the Auth client in use (the override, or firebase_admin.auth), or None if Firebase could not be initialized."""
+    if _auth_override is not None:
+        return _auth_override
+    ensure_initialized()
+    return _auth
+
+def use_firestore_client(client):
+    """
+    Replaces the Firestore client returned by get_db(), e.g. with fake_firestore.InMemoryFirestore()
+    for tests and benchmarks. Pass None to go back to the real client.
+    """
+    global _db_override
+    _db_override = client
+
+def use_auth_client(client):
+    """Replaces the Auth client returned by get_auth(), e.g. with fake_auth.InMemoryAuth(). Pass None to go back to the real client."""
+    global _auth_override
+    _auth_override = client
+
+def field_filter(field_path, op_string, value):
+    """
+    A Firestore query filter for query.where(filter=...). Uses the SDK's FieldFilter when it is
+    installed (positional where() arguments are deprecated); fake_firestore accepts either form.
+    """
+    try:
+        from google.cloud.firestore_v1.base_query import FieldFilter
+        return FieldFilter(field_path, op_string, value)
+    except ImportError:
+        from collections import namedtuple
+        return namedtuple("FieldFilter", "field_path op_string value")(field_path, op_string, value)
+
+_SERVER_TIMESTAMP = object() # Stands in for the SDK's sentinel when it is not installed
+
+def server_timestamp():
+    """
+    A field value that Firestore replaces with the time the write is committed. Uses the SDK's
+    SERVER_TIMESTAMP sentinel when it is installed; fake_firestore fills in the time of the write.
+    """
+    try:
+        from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+        return SERVER_TIMESTAMP
+    except ImportError:
+        return _SERVER_TIMESTAMP
+
+class _NotFound(Exception):
+    """Stands in for google.api_core's NotFound when it is not installed."""
+
+def not_found_error():
+    """
+    The exception Firestore raises for a missing document, e.g. on update(): google.api_core's
+    NotFound when it is installed. fake_firestore raises the same type.
+    """
+    try:
+        from google.api_core.exceptions import NotFound
+        return NotFound
+    except ImportError:
+        return _NotFound
+
+def __getattr__(name):
+    # Keeps `firebase_handler.db` / `firebase_handler.auth_client` working; both initialize on first access.
+    if name == 'db':
+        return get_db()
+    if name == 'auth_client':
+        return get_auth()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,105 @@
+# health.py
+"""
+Readiness checks that avoid the full startup cost. By default nothing heavy is imported and
+Firebase is not initialized; the credential source is only looked up. Also measures the cold
+import time of the core modules against IMPORT_TIME_BUDGET.
+
+    python health.py                  # exit code 0 when ready, 1 otherwise
+    python health.py --deep           # also initialize Firebase
+    python health.py --import-budget  # time each core module's import in a fresh interpreter
+
+The same checks are served at /healthz next to /metrics when METRICS_PORT is set.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Seconds a core module may take to import in a fresh interpreter. gradio (imported by app.py)
+# takes seconds on its own and is deliberately not part of the budget.
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "0.25"))
+
+CORE_MODULES = [
+    "firebase_handler", "auth_handler", "email_sender", "excel_handler", "template_engine",
+    "send_scheduler", "log_writer", "job_journal", "live_log", "job_manager", "metrics", "campaign_history", "sender_pool",
+]
+
+
+def _writable_dir(path):
+    path = os.path.abspath(path or ".")
+    while not os.path.exists(path):
+        path = os.path.dirname(path) # The directory is created on first use
+    return os.path.isdir(path) and os.access(path, os.W_OK)
+
+
+def check(deep=False):
+    """
+    Returns (ready, checks), where checks maps each check name to {'ok', 'detail'}.
+    With `deep`, Firebase is initialized (once per process) instead of only checking for credentials.
+    """
+    import firebase_handler
+    from excel_handler import RESULTS_DIR
+    from job_journal import JOURNAL_PATH
+    from sender_pool import sender_pool
+
+    checks = {}
+    initialized, error = firebase_handler.init_status()
+    if deep and not initialized:
+        ok, error = firebase_handler.ensure_initialized()
+        initialized = True
+    if initialized:
+        checks['firebase'] = {'ok': error is None, 'detail': error or "initialized"}
+    elif firebase_handler.credentials_configured():
+        checks['firebase'] = {'ok': True, 'detail': "credentials found (initialized on first use)"}
+    else:
+        checks['firebase'] = {'ok': False, 'detail': "no Firebase credentials configured"}
+
+    if sender_pool.configured:
+        checks['smtp'] = {'ok': True, 'detail': "sender accounts configured"}
+    elif os.getenv("GMAIL_APP_PASSWORD"):
+        checks['smtp'] = {'ok': True, 'detail': "GMAIL_APP_PASSWORD is set"}
+    else:
+        checks['smtp'] = {'ok': False, 'detail': "neither SENDER_ACCOUNTS nor GMAIL_APP_PASSWORD is set"}
+    checks['results_dir'] = {'ok': _writable_dir(RESULTS_DIR), 'detail': os.path.abspath(RESULTS_DIR)}
+    checks['job_journal'] = {'ok': _writable_dir(os.path.dirname(JOURNAL_PATH)), 'detail': os.path.abspath(JOURNAL_PATH)}
+    return all(c['ok'] for c in checks.values()), checks
+
+
+def measure_import_times(modules=CORE_MODULES):
+    """Imports each module in a fresh interpreter and returns {module: seconds}."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = {}
+    for module in modules:
+        code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+        result = subprocess.run([sys.executable, "-c", code], cwd=here, capture_output=True, text=True)
+        if result.returncode != 0:
+            times[module] = None
+            print(f"Importing {module} failed: {result.stderr.strip().splitlines()[-1] if result.stderr else 'unknown error'}")
+        else:
+            times[module] = float(result.stdout.strip().splitlines()[-1])
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Readiness checks for the email automation tool.")
+    parser.add_argument("--deep", action="store_true", help="Also initialize Firebase.")
+    parser.add_argument("--import-budget", action="store_true", help="Measure core module import times against IMPORT_TIME_BUDGET.")
+    args = parser.parse_args(argv)
+
+    if args.import_budget:
+        times = measure_import_times()
+        over = [m for m, seconds in times.items() if seconds is None or seconds > IMPORT_TIME_BUDGET]
+        for module, seconds in times.items():
+            shown = f"{seconds * 1000:8.1f} ms" if seconds is not None else "  failed"
+            print(f"  {module:<18}{shown}{'  OVER BUDGET' if module in over else ''}")
+        print(f"Budget: {IMPORT_TIME_BUDGET * 1000:.0f} ms per module; {len(over)} over.")
+        return 1 if over else 0
+
+    ready, checks = check(deep=args.deep)
+    print(json.dumps({'ready': ready, 'checks': checks}, indent=2))
+    return 0 if ready else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
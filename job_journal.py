@@ -0,0 +1,162 @@
+# job_journal.py
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+JOURNAL_PATH = os.getenv("JOB_JOURNAL_PATH", "job_journal.db")
+
+# Recipient states recorded in the journal. A recipient is 'pending' until an outcome is recorded.
+# 'deferred' marks a recipient that was waiting to retry a transient failure when its job stopped;
+# it is not an outcome, so a resumed job sends to it again.
+PENDING, SENT, FAILED, DEFERRED = "pending", "sent", "failed", "deferred"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    user_id TEXT,
+    sender_email TEXT,
+    subject_template TEXT,
+    body_template TEXT,
+    source_path TEXT,
+    total INTEGER,
+    status TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    html_template TEXT
+);
+CREATE TABLE IF NOT EXISTS recipient_events (
+    job_id TEXT,
+    row INTEGER,
+    state TEXT,
+    error TEXT,
+    recorded_at TEXT,
+    sender TEXT,
+    attempts INTEGER,
+    response_code INTEGER
+);
+CREATE INDEX IF NOT EXISTS recipient_events_job ON recipient_events (job_id, row);
+"""
+
+
+class JobJournal:
+    """
+    Local, append-only record of every campaign and of each recipient's outcome, kept in SQLite.
+    WAL mode with synchronous=NORMAL makes the per-message commit a cheap append to the log file,
+    and it survives process crashes (the last commits may be lost only on a power failure).
+    A recipient whose send completed but whose outcome was not yet committed when the process
+    died is treated as pending on resume, so at most the in-flight messages can be sent twice.
+    """
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        # Opened (and migrated) on first use, so importing this module doesn't create the database
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            # Journals from older versions lack the html_template, sender, attempts and response_code columns
+            for table, column, kind in (("jobs", "html_template", "TEXT"), ("recipient_events", "sender", "TEXT"),
+                                        ("recipient_events", "attempts", "INTEGER"),
+                                        ("recipient_events", "response_code", "INTEGER")):
+                columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+            self._conn = conn
+        return self._conn
+
+    def create_job(self, job_id, user_id, sender_email, subject_template, body_template, source_path, total, html_template=None):
+        now = datetime.now().isoformat()
+        with self._lock, self._db() as conn:
+            conn.execute(
+                """
+                INSERT INTO jobs (job_id, user_id, sender_email, subject_template, body_template, source_path,
+                                  total, status, created_at, updated_at, html_template)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (job_id, user_id, sender_email, subject_template, body_template, source_path, total, "queued", now, now, html_template),
+            )
+
+    def record(self, job_id, row, state, error=None, sender=None, attempts=None, response_code=None):
+        """
+        Appends a recipient outcome and commits it, with the sender account that handled it,
+        how many sends it took and the last SMTP reply code.
+        """
+        with self._lock, self._db() as conn:
+            conn.execute(
+                "INSERT INTO recipient_events (job_id, row, state, error, recorded_at, sender, attempts, response_code)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, int(row), state, error, datetime.now().isoformat(), sender, attempts, response_code),
+            )
+
+    def sender_usage(self, since):
+        """Sent and failed counts per sender account for outcomes recorded at or after `since` (a datetime)."""
+        with self._lock:
+            rows = self._db().execute(
+                """
+                SELECT sender, SUM(state = ?), SUM(state = ?) FROM recipient_events
+                WHERE sender IS NOT NULL AND recorded_at >= ? GROUP BY sender
+                """,
+                (SENT, FAILED, since.isoformat()),
+            ).fetchall()
+        return {sender: (sent or 0, failed or 0) for sender, sent, failed in rows}
+
+    def set_job_status(self, job_id, status):
+        with self._lock, self._db() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ?",
+                (status, datetime.now().isoformat(), job_id),
+            )
+
+    def get_job(self, job_id):
+        with self._lock:
+            conn = self._db()
+            conn.row_factory = sqlite3.Row
+            try:
+                row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            finally:
+                conn.row_factory = None
+        return dict(row) if row else None
+
+    def completed_rows(self, job_id):
+        """Rows that already have a recorded outcome (sent or failed); they are skipped on resume."""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT DISTINCT row FROM recipient_events WHERE job_id = ? AND state IN (?, ?)",
+                (job_id, SENT, FAILED),
+            ).fetchall()
+        return {row for (row,) in rows}
+
+    def resumable_jobs(self, user_id):
+        """Jobs of a user that stopped before every recipient had an outcome, newest first."""
+        with self._lock:
+            rows = self._db().execute(
+                """
+                SELECT j.job_id, j.created_at, j.total,
+                       (SELECT COUNT(DISTINCT e.row) FROM recipient_events e
+                        WHERE e.job_id = j.job_id AND e.state IN (?, ?)) AS done
+                FROM jobs j
+                WHERE j.user_id = ? AND j.status != 'completed'
+                ORDER BY j.created_at DESC
+                """,
+                (SENT, FAILED, user_id),
+            ).fetchall()
+        return [
+            {'job_id': job_id, 'created_at': created_at, 'total': total, 'done': done}
+            for job_id, created_at, total, done in rows
+            if done < total
+        ]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+# Instantiate the JobJournal
+job_journal = JobJournal()
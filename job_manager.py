@@ -0,0 +1,154 @@
+# job_manager.py
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Campaigns that may send at the same time across all users, and per user.
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "4"))
+PER_USER_JOB_LIMIT = int(os.getenv("PER_USER_JOB_LIMIT", "1"))
+
+QUEUED, RUNNING, FINISHED = "queued", "running", "finished"
+
+
+class SendJob:
+    """
+    State of one campaign, owned by a user and the browser session that started it.
+    Stop, progress and results are all reached through the job, never through process-wide globals.
+    """
+
+    def __init__(self, job_id, user_id, session_id):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.session_id = session_id
+        self.status = QUEUED
+        self.live_log = None # LiveLog, set once the recipients are known
+        self.results_writer = None # ResultsWriter for partial and final reports
+        self.message = None # Final status message
+        self.output_path = None # Final report path
+        self.error = None
+        self._interrupt = threading.Event()
+        self._done = threading.Event()
+
+    def stop(self):
+        self._interrupt.set()
+
+    @property
+    def interrupted(self):
+        return self._interrupt.is_set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+class JobManager:
+    """
+    Runs campaigns on a shared pool of `max_concurrent_jobs` slots. Each user may run at most
+    `per_user_limit` campaigns at once; further campaigns wait in a per-user queue, and free
+    slots are handed out round-robin across users so one tenant's backlog cannot starve another.
+    """
+
+    def __init__(self, max_concurrent_jobs=MAX_CONCURRENT_JOBS, per_user_limit=PER_USER_JOB_LIMIT):
+        self.max_concurrent_jobs = max(1, max_concurrent_jobs)
+        self.per_user_limit = max(1, per_user_limit)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent_jobs, thread_name_prefix="campaign")
+        self._queues = OrderedDict() # user_id -> deque of (job, run_fn); order is the round-robin order
+        self._running = {} # user_id -> number of running jobs
+        self._jobs = {} # job_id -> SendJob
+        self._free_slots = self.max_concurrent_jobs
+        self._lock = threading.Lock()
+
+    def submit(self, job, run_fn):
+        """Queues `run_fn(job)` to run on the shared pool and returns the job."""
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._queues.setdefault(job.user_id, deque()).append((job, run_fn))
+        self._dispatch()
+        return job
+
+    def _dispatch(self):
+        with self._lock:
+            while self._free_slots > 0:
+                picked = None
+                for user_id, queue in self._queues.items():
+                    if queue and self._running.get(user_id, 0) < self.per_user_limit:
+                        picked = user_id
+                        break
+                if picked is None:
+                    return
+                job, run_fn = self._queues[picked].popleft()
+                self._queues.move_to_end(picked) # The next free slot goes to someone else first
+                if not self._queues[picked]:
+                    del self._queues[picked]
+                self._running[picked] = self._running.get(picked, 0) + 1
+                self._free_slots -= 1
+                job.status = RUNNING
+                self._executor.submit(self._run, job, run_fn)
+
+    def _run(self, job, run_fn):
+        try:
+            if not job.interrupted:
+                run_fn(job)
+        except Exception as e:
+            job.error = str(e)
+            print(f"Error in job {job.job_id}: {e}")
+        finally:
+            with self._lock:
+                self._running[job.user_id] -= 1
+                if not self._running[job.user_id]:
+                    del self._running[job.user_id]
+                self._free_slots += 1
+                job.status = FINISHED
+            job._done.set()
+            self._dispatch()
+
+    def get(self, job_id, user_id):
+        """Returns the job if it exists and belongs to `user_id`."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job is not None and job.user_id == user_id else None
+
+    def stop(self, job_id, user_id):
+        """Interrupts a user's job. A queued job is removed from the queue; a running one stops dispatching."""
+        job = self.get(job_id, user_id)
+        if job is None or job.done:
+            return False
+        job.stop()
+        with self._lock:
+            queue = self._queues.get(user_id)
+            entry = next((entry for entry in queue if entry[0] is job), None) if queue else None
+            if entry is not None:
+                queue.remove(entry)
+                if not queue:
+                    del self._queues[user_id]
+                job.status = FINISHED
+                job.message = "Job cancelled before it started."
+                job._done.set()
+        return True
+
+    def queue_position(self, job):
+        """1-based position of a queued job within its user's queue, or 0 if it is not queued."""
+        with self._lock:
+            for position, (queued, _) in enumerate(self._queues.get(job.user_id, ()), start=1):
+                if queued is job:
+                    return position
+        return 0
+
+    def active_jobs(self, user_id=None):
+        with self._lock:
+            return [job for job in self._jobs.values()
+                    if not job.done and (user_id is None or job.user_id == user_id)]
+
+    def forget(self, job_id):
+        """Drops a finished job's record."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.done:
+                del self._jobs[job_id]
+
+# Instantiate the JobManager
+job_manager = JobManager()
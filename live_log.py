@@ -0,0 +1,90 @@
+# live_log.py
+import os
+import threading
+import time
+from collections import deque
+
+LIVE_LOG_SIZE = int(os.getenv("LIVE_LOG_SIZE", "50"))
+LIVE_REFRESH_INTERVAL = float(os.getenv("LIVE_REFRESH_INTERVAL", "1.0"))
+
+STATUS_ICONS = {'sent': '✅ Sent', 'failed': '❌ Failed'}
+
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s" if hours else f"{minutes}m {seconds:02d}s"
+
+
+class LiveLog:
+    """
+    Bounded view of a running job for the dashboard: the most recent `size` log entries in a
+    ring buffer plus running counters. Rendering cost depends only on `size`, not on how many
+    messages the campaign has sent.
+    """
+
+    def __init__(self, total, size=LIVE_LOG_SIZE):
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.retrying = set() # Rows waiting to be resent after a transient failure
+        self.recent = deque(maxlen=size)
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def retry_scheduled(self, row):
+        with self._lock:
+            self.retrying.add(row)
+
+    def record(self, entry):
+        with self._lock:
+            self.retrying.discard(entry.get('row'))
+            if entry['status'] == 'sent':
+                self.sent += 1
+            else:
+                self.failed += 1
+            self.recent.append(entry)
+
+    def snapshot(self):
+        with self._lock:
+            done = self.sent + self.failed
+            elapsed = max(time.monotonic() - self.started_at, 1e-6)
+            rate = done / elapsed
+            pending = max(self.total - done, 0)
+            return {
+                'total': self.total,
+                'sent': self.sent,
+                'failed': self.failed,
+                'pending': pending,
+                'retrying': len(self.retrying),
+                'rate': rate,
+                'elapsed': elapsed,
+                'eta': pending / rate if rate > 0 else None,
+                'recent': list(self.recent),
+            }
+
+    def render_status(self, headline="Sending..."):
+        stats = self.snapshot()
+        eta = _format_duration(stats['eta']) if stats['eta'] is not None else "—"
+        retrying = f" (🔁 {stats['retrying']} awaiting retry)" if stats['retrying'] else ""
+        return (
+            f"**{headline}** ✅ Sent: {stats['sent']} | ❌ Failed: {stats['failed']} | "
+            f"⏳ Pending: {stats['pending']} of {stats['total']}{retrying} | "
+            f"{stats['rate']:.2f} msgs/sec | Elapsed: {_format_duration(stats['elapsed'])} | ETA: {eta}"
+        )
+
+    def render_logs(self):
+        """Markdown table of the most recent entries, newest first."""
+        recent = self.snapshot()['recent']
+        if not recent:
+            return "No logs yet."
+        lines = ["| Time | Name | Email | Status | Error |", "|---|---|---|---|---|"]
+        for entry in reversed(recent):
+            error = (entry.get('error') or '').replace('|', '\\|').replace('\n', ' ')
+            tries = f" ({entry['attempts']} tries)" if (entry.get('attempts') or 1) > 1 else ""
+            lines.append(
+                f"| {entry['timestamp'].strftime('%H:%M:%S')} | {entry['name']} | {entry['email']} | "
+                f"{STATUS_ICONS.get(entry['status'], entry['status'])}{tries} | {error} |"
+            )
+        return "\n".join(lines)
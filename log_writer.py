@@ -0,0 +1,180 @@
+# log_writer.py
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from firebase_handler import get_db, server_timestamp
+from metrics import firestore_commit_seconds, firestore_entries_total
+
+# Firestore accepts at most 500 writes in a single batch commit.
+FIRESTORE_MAX_BATCH = 500
+
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "100"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "2.0"))
+LOG_SPILL_PATH = os.getenv("LOG_SPILL_PATH", "failed_email_logs.jsonl")
+
+# Locks per spill file, shared by every writer in the process: each job has its own writer but they
+# all spill to the same path. The spill lock guards appends and rewrites of the file; the replay lock
+# is held for a whole replay, so two jobs starting together don't commit the same entries twice.
+_spill_locks = {}
+_replay_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(locks, path):
+    with _locks_guard:
+        return locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _decode(obj):
+    if "__datetime__" in obj and len(obj) == 1:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+class FirestoreLogWriter:
+    """
+    Queues log entries and writes them to Firestore from a background thread as batch commits,
+    flushing when `batch_size` entries are waiting or every `flush_interval` seconds.
+    Entries from a commit that fails are appended to a local JSONL file so they can be replayed later.
+    """
+
+    def __init__(self, collection='emailLogs', client=None, batch_size=LOG_BATCH_SIZE,
+                 flush_interval=LOG_FLUSH_INTERVAL, spill_path=LOG_SPILL_PATH):
+        self.collection = collection
+        self.client = client
+        self.batch_size = max(1, min(batch_size, FIRESTORE_MAX_BATCH))
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.written = 0
+        self.spilled = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._spill_lock = _lock_for(_spill_locks, spill_path)
+        self._replay_lock = _lock_for(_replay_locks, spill_path)
+
+    def _client(self):
+        return self.client if self.client is not None else get_db()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="firestore-log-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def add(self, entry):
+        """Queues a log entry. Never blocks on Firestore."""
+        self._queue.put(("entry", entry))
+
+    def close(self, timeout=None):
+        """Flushes remaining entries and stops the background thread."""
+        if self._thread is None:
+            return
+        self._queue.put(("stop", None))
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        pending = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                kind, payload = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                kind, payload = "tick", None
+
+            if kind == "entry":
+                pending.append(payload)
+                if len(pending) < self.batch_size:
+                    continue
+            self._commit(pending)
+            pending = []
+            deadline = time.monotonic() + self.flush_interval
+            if kind == "stop":
+                return
+
+    def _commit(self, entries):
+        if not entries:
+            return
+        try:
+            client = self._client()
+            if client is None:
+                raise RuntimeError("Firestore client is not initialized.")
+            collection = client.collection(self.collection)
+            batch = client.batch()
+            for entry in entries:
+                batch.set(collection.document(), dict(entry, committedAt=server_timestamp()))
+            with firestore_commit_seconds.time():
+                batch.commit()
+            self.written += len(entries)
+            firestore_entries_total.inc(len(entries), result="written")
+            print(f"Logged {len(entries)} entries to Firestore '{self.collection}'.")
+        except Exception as e:
+            print(f"Error committing {len(entries)} log entries to Firestore: {e}. Saving them to {self.spill_path}.")
+            self._spill(entries)
+
+    def _spill(self, entries):
+        with self._spill_lock:
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps({"collection": self.collection, "data": entry}, default=_encode) + "\n")
+        self.spilled += len(entries)
+        firestore_entries_total.inc(len(entries), result="spilled")
+
+    def replay_spilled(self):
+        """
+        Re-commits entries saved by earlier failed commits. The file is only rewritten once the
+        commits are done, keeping the entries that failed again and any appended meanwhile, so a
+        crash during the replay loses nothing (at worst some entries are committed twice).
+        Returns the number of entries replayed; 0 if another writer is already replaying the file.
+        """
+        if not self._replay_lock.acquire(blocking=False):
+            return 0
+        try:
+            with self._spill_lock:
+                if not os.path.exists(self.spill_path):
+                    return 0
+                with open(self.spill_path, "r", encoding="utf-8") as f:
+                    lines = [line for line in f if line.strip()]
+            if not lines:
+                return 0
+
+            client = self._client()
+            replayed = 0
+            failed = []
+            for start in range(0, len(lines), FIRESTORE_MAX_BATCH):
+                chunk = lines[start:start + FIRESTORE_MAX_BATCH]
+                try:
+                    batch = client.batch()
+                    for line in chunk:
+                        record = json.loads(line, object_hook=_decode)
+                        batch.set(client.collection(record["collection"]).document(),
+                                  dict(record["data"], committedAt=server_timestamp()))
+                    batch.commit()
+                    replayed += len(chunk)
+                except Exception as e:
+                    print(f"Error replaying saved log entries: {e}")
+                    failed.extend(chunk)
+
+            with self._spill_lock:
+                # Other writers only append, so everything past the lines read was spilled during the replay
+                with open(self.spill_path, "r", encoding="utf-8") as f:
+                    remaining = failed + [line for line in f if line.strip()][len(lines):]
+                temp_path = self.spill_path + ".tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    f.writelines(remaining)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.spill_path)
+            return replayed
+        finally:
+            self._replay_lock.release()
@@ -0,0 +1,240 @@
+# metrics.py
+"""
+Low-overhead, in-process timing histograms and counters for the campaign hot path, rendered in
+the Prometheus text exposition format. Set METRICS_PORT to also serve them at /metrics (with
+readiness checks from health.py at /healthz).
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_PORT = os.getenv("METRICS_PORT") # e.g. 9100; unset means no HTTP endpoint
+
+# Seconds. Covers sub-millisecond MIME builds up to slow TLS handshakes and Firestore commits.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {} # label tuple -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_label_text(key + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_label_text(key)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = dict(self._values)
+        for key, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{_label_text(key)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        with self._lock:
+            return self._metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+    def counter(self, name, help_text):
+        with self._lock:
+            return self._metrics.setdefault(name, Counter(name, help_text))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in sorted(metrics, key=lambda m: m.name):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# The process-wide registry used by the handler modules
+registry = MetricsRegistry()
+
+# Hot-path metrics, by phase
+excel_parse_seconds = registry.histogram("email_tool_excel_parse_seconds", "Time spent ingesting an upload, by step (open/read/validate per batch).")
+excel_rows_total = registry.counter("email_tool_excel_rows_total", "Recipient rows read, by outcome (accepted/rejected).")
+mime_build_seconds = registry.histogram("email_tool_mime_build_seconds", "Time to build a message's MIME structure.")
+smtp_connect_seconds = registry.histogram("email_tool_smtp_connect_seconds", "Time to open an SMTP connection (TCP and TLS handshake).")
+smtp_auth_seconds = registry.histogram("email_tool_smtp_auth_seconds", "Time to authenticate an SMTP session.")
+smtp_data_seconds = registry.histogram("email_tool_smtp_data_seconds", "Time to transmit a message (MAIL/RCPT/DATA).")
+smtp_messages_total = registry.counter("email_tool_smtp_messages_total", "Messages handed to SMTP, by result (sent/deferred/failed; deferred is a transient failure).")
+smtp_reconnects_total = registry.counter("email_tool_smtp_reconnects_total", "Pooled sessions found disconnected and reopened.")
+firestore_commit_seconds = registry.histogram("email_tool_firestore_commit_seconds", "Time to commit a batch of emailLogs entries.")
+firestore_entries_total = registry.counter("email_tool_firestore_entries_total", "emailLogs entries written, by result (written/spilled).")
+send_retries_total = registry.counter("email_tool_send_retries_total", "Transient send failures rescheduled with backoff, by reply code.")
+send_loop_seconds = registry.histogram("email_tool_send_loop_seconds", "Per-recipient time in the campaign loop, by step (send/record).")
+
+
+# Up to Python 3.11 cProfile only sees the thread it is enabled in. From 3.12 it is built on
+# sys.monitoring, which is process-wide and allows a single active profiler.
+PER_THREAD_PROFILERS = sys.version_info < (3, 12)
+
+
+class JobProfiler:
+    """
+    Optional cProfile capture for a single job. Before Python 3.12 every thread that runs part
+    of the job gets its own profiler and the results are merged. From 3.12 the outermost call
+    (the job thread) enables one profiler that also sees the worker threads, and nested calls
+    just run. If another profiler is already active (e.g. a second profiled job), the work runs
+    unprofiled instead of failing.
+    """
+
+    def __init__(self):
+        self._profiles = []
+        self._local = threading.local()
+        self._active = False # Whether the single profiler (Python 3.12+) is enabled
+        self._lock = threading.Lock()
+
+    def _new_profile(self):
+        import cProfile
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        return profile
+
+    def call(self, fn, *args, **kwargs):
+        """Runs `fn` under this job's profiler."""
+        if PER_THREAD_PROFILERS:
+            profile = getattr(self._local, "profile", None)
+            if profile is None:
+                profile = self._local.profile = self._new_profile()
+        else:
+            with self._lock:
+                nested, self._active = self._active, True
+            if nested:
+                return fn(*args, **kwargs) # Already seen by the profiler enabled around the job
+            profile = self._profiles[0] if self._profiles else self._new_profile()
+        try:
+            profile.enable()
+        except ValueError as e: # "Another profiling tool is already active"
+            print(f"Profiling skipped: {e}")
+            profile = None
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if profile is not None:
+                profile.disable()
+            if not PER_THREAD_PROFILERS:
+                with self._lock:
+                    self._active = False
+
+    def save(self, path, top=30):
+        """Writes the merged stats to `path` (pstats format) and returns a text summary."""
+        import io
+        import pstats
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = None
+        for profile in profiles:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            except TypeError:
+                continue # Never enabled, e.g. because another profiler was already active
+        if stats is None:
+            return "No profile data captured."
+        stats.dump_stats(path)
+        summary = io.StringIO()
+        stats.stream = summary
+        stats.sort_stats("cumulative").print_stats(top)
+        return summary.getvalue()
+
+
+def start_metrics_server(port=METRICS_PORT, host="0.0.0.0"):
+    """Serves /metrics and /healthz on a background thread. Returns the server, or None if no port is configured."""
+    if port in (None, ""):
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer # Only needed when serving
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/metrics":
+                status, content_type, body = 200, "text/plain; version=0.0.4; charset=utf-8", registry.render()
+            elif path == "/healthz":
+                import json
+                from health import check
+                ready, checks = check()
+                status, content_type = (200 if ready else 503), "application/json"
+                body = json.dumps({'ready': ready, 'checks': checks})
+            else:
+                self.send_error(404)
+                return
+            body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # Scrapes are frequent; keep them out of the console
+
+    server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Metrics available at http://{host}:{server.server_address[1]}/metrics")
+    return server
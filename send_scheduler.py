@@ -0,0 +1,312 @@
+# send_scheduler.py
+import asyncio
+import heapq
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Scheduler defaults. The rate defaults to one message every 20 seconds per sender,
+# which matches the previous fixed delay; raise it to the provider's real quota.
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "1"))
+SEND_RATE_PER_SECOND = float(os.getenv("SEND_RATE_PER_SECOND", "0.05"))
+SEND_BURST = int(os.getenv("SEND_BURST", "1"))
+SEND_BACKEND = os.getenv("SEND_BACKEND", "thread") # "thread" or "asyncio"
+
+# Transient failures (4xx replies, dropped connections) are retried up to SEND_MAX_ATTEMPTS sends in
+# total, waiting base * 2^(n-1) seconds (capped at the max) with jitter before the n-th retry.
+SEND_MAX_ATTEMPTS = int(os.getenv("SEND_MAX_ATTEMPTS", "4"))
+SEND_RETRY_BASE_DELAY = float(os.getenv("SEND_RETRY_BASE_DELAY", "30"))
+SEND_RETRY_MAX_DELAY = float(os.getenv("SEND_RETRY_MAX_DELAY", "900"))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: allows `rate` messages per second on average,
+    with up to `burst` messages sent back to back.
+    """
+
+    def __init__(self, rate, burst=1):
+        if rate <= 0:
+            raise ValueError("Token bucket rate must be positive.")
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self._tokens = 1.0 # The first message goes out immediately, the burst builds up after it
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self):
+        """Takes a token if one is available. Returns 0 on success, or the seconds to wait otherwise."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, should_stop=None, poll_interval=0.5):
+        """
+        Blocks until a token is available. Returns False without taking a token
+        if `should_stop()` becomes true while waiting.
+        """
+        while True:
+            if should_stop and should_stop():
+                return False
+            wait = self.try_acquire()
+            if wait == 0:
+                return True
+            time.sleep(min(wait, poll_interval))
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with "equal jitter": the n-th retry waits between half and all of
+    min(max_delay, base_delay * 2^(n-1)) seconds, so retries from many recipients spread out.
+    """
+
+    def __init__(self, max_attempts=SEND_MAX_ATTEMPTS, base_delay=SEND_RETRY_BASE_DELAY, max_delay=SEND_RETRY_MAX_DELAY):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+
+    def delay_for(self, attempts):
+        """Seconds to wait before the next try after `attempts` failed sends, or None once they are used up."""
+        if attempts >= self.max_attempts:
+            return None
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class SendScheduler:
+    """
+    Runs a send function over a list of items on N workers, paced by a token bucket per sender.
+    `on_result(index, item, result)` is always called from the calling thread, in item order,
+    so progress reporting stays sequential even though sends complete out of order. Items deferred
+    for a retry (see run()) are the exception: they are reported when their last try completes.
+    """
+
+    def __init__(self, workers=SEND_WORKERS, rate=SEND_RATE_PER_SECOND, burst=SEND_BURST, backend=SEND_BACKEND):
+        if backend not in ("thread", "asyncio"):
+            raise ValueError(f"Unknown send backend: {backend}")
+        self.workers = max(1, int(workers))
+        self.rate = rate
+        self.burst = burst
+        self.backend = backend
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+
+    def bucket_for(self, sender_key, rate=None, burst=None):
+        """Returns the token bucket for a sender, creating it on first use."""
+        with self._buckets_lock:
+            bucket = self._buckets.get(sender_key)
+            if bucket is None:
+                bucket = TokenBucket(rate or self.rate, burst or self.burst)
+                self._buckets[sender_key] = bucket
+            return bucket
+
+    def run(self, items, send_fn, on_result=None, should_stop=None, sender_key=None, retry_delay=None, on_deferred=None):
+        """
+        Sends every item with `send_fn(item)` and returns the number of items dispatched.
+        `should_stop()` is checked before each dispatch; once it returns true no new sends
+        start, and in-flight sends are allowed to finish and are still reported.
+        `sender_key(item)` selects the token bucket an item draws from (one shared bucket by default).
+        `retry_delay(item, result, attempts)` may return seconds after which a failed item is sent
+        again (None reports the result as final). Deferred items wait in a queue ordered by due
+        time while other items keep being sent. If the run is stopped, items still waiting have no
+        final outcome: they are passed to `on_deferred(index, item, last result)` instead of
+        `on_result`, so every item is reported exactly once through one of the two.
+        """
+        if self.backend == "asyncio":
+            return asyncio.run(self._run_async(items, send_fn, on_result, should_stop, sender_key, retry_delay, on_deferred))
+        return self._run_threads(items, send_fn, on_result, should_stop, sender_key, retry_delay, on_deferred)
+
+    def _run_threads(self, items, send_fn, on_result, should_stop, sender_key, retry_delay, on_deferred):
+        items = iter(items)
+        in_flight = {} # future -> (index, item, attempts including this one)
+        first_results = {} # index -> (item, result) of first tries awaiting their turn to be reported
+        deferred = [] # heap of (due time, index, item, attempts so far, last result)
+        deferred_rows = set() # indexes taken out of the in-order report
+        next_to_report = 0
+        dispatched = 0
+        exhausted = stopped = False
+
+        def report_ready():
+            nonlocal next_to_report
+            while True:
+                if next_to_report in deferred_rows:
+                    deferred_rows.discard(next_to_report)
+                elif next_to_report in first_results:
+                    item, result = first_results.pop(next_to_report)
+                    if on_result:
+                        on_result(next_to_report, item, result)
+                else:
+                    break
+                next_to_report += 1
+
+        def collect(timeout):
+            done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, item, attempts = in_flight.pop(future)
+                result = future.result()
+                delay = retry_delay(item, result, attempts) if retry_delay else None
+                if delay is not None:
+                    heapq.heappush(deferred, (time.monotonic() + delay, index, item, attempts, result))
+                    if attempts == 1:
+                        deferred_rows.add(index)
+                elif attempts == 1:
+                    first_results[index] = (item, result)
+                elif on_result:
+                    on_result(index, item, result) # Final outcome of a retried item
+            report_ready()
+
+        def submit(index, item, attempts):
+            bucket = self.bucket_for(sender_key(item) if sender_key else None)
+            if not bucket.acquire(should_stop):
+                return False
+            in_flight[executor.submit(send_fn, item)] = (index, item, attempts)
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="send-worker") as executor:
+            while True:
+                if in_flight:
+                    collect(timeout=0)
+                if not stopped and should_stop and should_stop():
+                    stopped = True
+                # A retry still in flight may be deferred again, so wait for it before finishing
+                if stopped or (exhausted and not deferred and not in_flight):
+                    break
+                # Keep at most `workers` sends in flight so results are reported promptly.
+                if len(in_flight) >= self.workers:
+                    collect(timeout=None)
+                    continue
+                now = time.monotonic()
+                if deferred and deferred[0][0] <= now:
+                    entry = heapq.heappop(deferred)
+                    _, index, item, attempts, _ = entry
+                    if not submit(index, item, attempts + 1):
+                        heapq.heappush(deferred, entry)
+                        stopped = True
+                    continue
+                if not exhausted:
+                    entry = next(items, None)
+                    if entry is None:
+                        exhausted = True
+                        continue
+                    if not submit(dispatched, entry, 1):
+                        stopped = True
+                        continue
+                    dispatched += 1
+                    continue
+                # Only retries are left: wait for the next one to fall due (or a send to finish)
+                timeout = min(deferred[0][0] - now, 0.5) if deferred else None
+                if in_flight:
+                    collect(timeout=timeout)
+                else:
+                    time.sleep(timeout)
+            while in_flight:
+                collect(timeout=None)
+            # Stopped with retries still waiting: they have no outcome yet
+            for _, index, item, _, result in sorted(deferred, key=lambda entry: entry[1]):
+                if on_deferred:
+                    on_deferred(index, item, result)
+        return dispatched
+
+    async def _run_async(self, items, send_fn, on_result, should_stop, sender_key, retry_delay, on_deferred):
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="send-worker")
+        slots = asyncio.Semaphore(self.workers)
+        dispatched = 0
+        retries = set() # Tasks waiting out a backoff or resending a deferred item
+        deferred = object() # Marks a first try that was handed to a retry task
+
+        async def send_one(item):
+            try:
+                # smtplib is blocking, so the send itself runs on the executor.
+                return await loop.run_in_executor(executor, send_fn, item)
+            finally:
+                slots.release()
+
+        async def wait_for_token(bucket):
+            while True:
+                if should_stop and should_stop():
+                    return False
+                wait = bucket.try_acquire()
+                if wait == 0:
+                    return True
+                await asyncio.sleep(min(wait, 0.5))
+
+        def stopping():
+            return bool(should_stop and should_stop())
+
+        async def retry(index, item, attempts, result, delay):
+            # Waits out the backoff without holding a slot, so other items keep being sent meanwhile
+            while delay is not None:
+                due = loop.time() + delay
+                while loop.time() < due and not stopping():
+                    await asyncio.sleep(min(due - loop.time(), 0.5))
+                if stopping():
+                    break
+                await slots.acquire()
+                if not await wait_for_token(self.bucket_for(sender_key(item) if sender_key else None)):
+                    slots.release()
+                    break
+                result = await send_one(item)
+                attempts += 1
+                delay = retry_delay(item, result, attempts)
+            if delay is not None: # Stopped while waiting for a retry: no outcome yet
+                if on_deferred:
+                    on_deferred(index, item, result)
+            elif on_result:
+                on_result(index, item, result)
+
+        async def first_try(index, item):
+            result = await send_one(item)
+            delay = retry_delay(item, result, 1) if retry_delay else None
+            if delay is not None:
+                task = asyncio.create_task(retry(index, item, 1, result, delay))
+                retries.add(task)
+                task.add_done_callback(retries.discard)
+                return deferred
+            return result
+
+        queue = asyncio.Queue() # (item, task) in dispatch order; None marks the end
+
+        async def report_in_order():
+            index = 0
+            while True:
+                entry = await queue.get()
+                if entry is None:
+                    return
+                item, task = entry
+                result = await task
+                if on_result and result is not deferred:
+                    on_result(index, item, result)
+                index += 1
+
+        report_task = asyncio.create_task(report_in_order())
+        try:
+            for index, item in enumerate(items):
+                await slots.acquire()
+                if should_stop and should_stop():
+                    slots.release()
+                    break
+                bucket = self.bucket_for(sender_key(item) if sender_key else None)
+                if not await wait_for_token(bucket):
+                    slots.release()
+                    break
+                task = asyncio.create_task(first_try(index, item))
+                await queue.put((item, task))
+                dispatched += 1
+            await queue.put(None)
+            await report_task
+            while retries:
+                await asyncio.gather(*list(retries))
+        finally:
+            executor.shutdown(wait=True)
+        return dispatched
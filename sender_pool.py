@@ -0,0 +1,182 @@
+# sender_pool.py
+import json
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from job_journal import job_journal
+from send_scheduler import SEND_BURST, SEND_RATE_PER_SECOND
+
+# Sender accounts as a JSON list, either inline (SENDER_ACCOUNTS) or in a file (SENDER_ACCOUNTS_FILE):
+# [{"email": "a@gmail.com", "app_password": "...", "rate_per_second": 0.05, "burst": 1, "daily_quota": 500}, ...]
+# Only "email" and "app_password" are required. Without either setting, campaigns send from the
+# address entered in the dashboard with GMAIL_APP_PASSWORD.
+SENDER_ACCOUNTS = os.getenv("SENDER_ACCOUNTS")
+SENDER_ACCOUNTS_FILE = os.getenv("SENDER_ACCOUNTS_FILE", "sender_accounts.json")
+# Messages per account per day; 0 means no limit
+SENDER_DAILY_QUOTA = int(os.getenv("SENDER_DAILY_QUOTA", "0"))
+
+
+class SenderAccount:
+    """One sending identity: its credentials, pacing, today's send counts and the sends reserved by running jobs."""
+
+    def __init__(self, email, app_password, rate=SEND_RATE_PER_SECOND, burst=SEND_BURST, daily_quota=SENDER_DAILY_QUOTA):
+        self.email = email
+        self.app_password = app_password
+        self.rate = float(rate)
+        self.burst = int(burst)
+        self.daily_quota = int(daily_quota or 0)
+        self.sent_today = 0
+        self.failed_today = 0
+        self.reserved = 0 # Planned by running jobs but not recorded yet
+
+    @property
+    def headroom(self):
+        """Messages this account may still plan today, or None if it has no daily quota."""
+        if not self.daily_quota:
+            return None
+        return max(0, self.daily_quota - self.sent_today - self.failed_today - self.reserved)
+
+
+def domain_of(email):
+    return email.rpartition('@')[2].lower()
+
+
+def interleave_domains(recipients):
+    """
+    Orders recipients so each receiving domain is spread evenly over the whole campaign instead of
+    arriving in a block: the k-th of a domain's n recipients is placed at fraction (k + 0.5) / n.
+    """
+    by_domain = defaultdict(list)
+    for recipient in recipients:
+        by_domain[domain_of(recipient['email'])].append(recipient)
+    keyed = []
+    for group in by_domain.values():
+        n = len(group)
+        keyed.extend(((k + 0.5) / n, recipient['row'], recipient) for k, recipient in enumerate(group))
+    keyed.sort(key=lambda entry: entry[:2])
+    return [recipient for _, _, recipient in keyed]
+
+
+class SenderPool:
+    """
+    The configured sender accounts. plan() spreads a campaign's recipients over them in proportion
+    to their rates (smooth weighted round-robin), within each account's remaining daily quota, and
+    reserves that quota so concurrent jobs can't plan the same headroom: record() turns a reserved
+    send into a counted one and release() returns what a finished job didn't use.
+    Counts are kept per calendar day and reloaded from `usage(since)` (the job journal) when the day changes.
+    """
+
+    def __init__(self, accounts=None, usage=None):
+        self._configured = {account.email: account for account in (accounts or [])}
+        self._adhoc = {} # Single accounts entered in the dashboard, kept so their counts accumulate
+        self._usage = usage
+        self._day = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, usage=None):
+        raw = SENDER_ACCOUNTS
+        if not raw and SENDER_ACCOUNTS_FILE and os.path.exists(SENDER_ACCOUNTS_FILE):
+            with open(SENDER_ACCOUNTS_FILE, encoding="utf-8") as f:
+                raw = f.read()
+        accounts = []
+        for entry in json.loads(raw) if raw else []:
+            accounts.append(SenderAccount(
+                entry['email'], entry['app_password'],
+                rate=entry.get('rate_per_second', SEND_RATE_PER_SECOND),
+                burst=entry.get('burst', SEND_BURST),
+                daily_quota=entry.get('daily_quota', SENDER_DAILY_QUOTA),
+            ))
+        return cls(accounts, usage)
+
+    @property
+    def configured(self):
+        return bool(self._configured)
+
+    def _roll_day(self):
+        # Called with the lock held: reset counts at midnight, seeding them from recorded outcomes
+        today = datetime.now().date()
+        if self._day == today:
+            return
+        self._day = today
+        usage = self._usage(datetime.combine(today, datetime.min.time())) if self._usage else {}
+        for account in list(self._configured.values()) + list(self._adhoc.values()):
+            account.sent_today, account.failed_today = usage.get(account.email, (0, 0))
+
+    def accounts_for(self, sender_email=None, app_password=None):
+        """The pool's accounts, or (without a configured pool) the single account entered for the campaign."""
+        with self._lock:
+            if self._configured:
+                accounts = list(self._configured.values())
+            else:
+                account = self._adhoc.get(sender_email)
+                if account is None or account.app_password != app_password:
+                    account = self._adhoc[sender_email] = SenderAccount(sender_email, app_password)
+                    self._day = None # Load this account's counts for today
+                accounts = [account]
+            self._roll_day()
+            return accounts
+
+    def plan(self, recipients, accounts):
+        """
+        Returns ([(recipient, account), ...] in send order, number of recipients left over because
+        every account's daily quota is used up). Receiving domains are interleaved first. The planned
+        sends are reserved against each account's quota until they are recorded or released.
+        """
+        ordered = interleave_domains(recipients)
+        current = {account.email: 0.0 for account in accounts}
+        plan = []
+        with self._lock: # Held while planning, so the headroom read is reserved before another job sees it
+            self._roll_day()
+            remaining = {account.email: account.headroom for account in accounts}
+            for recipient in ordered:
+                available = [a for a in accounts if remaining[a.email] is None or remaining[a.email] > 0]
+                if not available:
+                    break
+                total = sum(a.rate for a in available)
+                for account in available:
+                    current[account.email] += account.rate
+                chosen = max(available, key=lambda a: current[a.email])
+                current[chosen.email] -= total
+                if remaining[chosen.email] is not None:
+                    remaining[chosen.email] -= 1
+                chosen.reserved += 1
+                plan.append((recipient, chosen))
+        return plan, len(ordered) - len(plan)
+
+    def record(self, account, success):
+        """Counts the outcome of one planned send, which no longer needs its reservation."""
+        with self._lock:
+            self._roll_day()
+            account.reserved = max(0, account.reserved - 1)
+            if success:
+                account.sent_today += 1
+            else:
+                account.failed_today += 1
+
+    def release(self, account, count):
+        """Returns `count` reserved sends a job planned but did not make (stopped, or left for a resume)."""
+        with self._lock:
+            account.reserved = max(0, account.reserved - count)
+
+    def render_accounts(self, accounts, job_counts=None):
+        """Markdown table of per-account pacing, today's counts and quota headroom (plus this job's sends, if given)."""
+        with self._lock:
+            self._roll_day()
+            rows = [(a.email, a.rate, a.sent_today, a.failed_today, a.daily_quota, a.headroom) for a in accounts]
+        header = "| Sender | Rate (msg/s) | Sent today | Failed today | Daily quota | Headroom |"
+        if job_counts is not None:
+            header += " This job |"
+        lines = [header, "|---" * (header.count("|") - 1) + "|"]
+        for email, rate, sent, failed, quota, headroom in rows:
+            line = (f"| {email} | {rate:g} | {sent} | {failed} | {quota or '∞'} | "
+                    f"{'∞' if headroom is None else headroom} |")
+            if job_counts is not None:
+                line += f" {job_counts.get(email, 0)} |"
+            lines.append(line)
+        return "\n".join(lines)
+
+# Instantiate the SenderPool; today's counts come from outcomes recorded in the job journal
+sender_pool = SenderPool.from_env(usage=job_journal.sender_usage)
@@ -0,0 +1,130 @@
+# smtp_sink.py
+"""
+A minimal local SMTP server that accepts and discards every message. It answers EHLO, AUTH
+(any credentials), MAIL, RCPT, DATA, RSET, NOOP and QUIT, which is enough for EmailSender
+(plain SMTP, no TLS). Replies to AUTH, MAIL, RCPT or DATA can be replaced to simulate a refusing
+server (e.g. replies={"RCPT": "550 5.1.1 No such user"}). Used by benchmark.py and the tests; it
+can also be run on its own as a test relay:
+
+    python smtp_sink.py --port 1025
+    SMTP_HOST=localhost SMTP_PORT=1025 SMTP_USE_SSL=false python app.py
+"""
+import argparse
+import socketserver
+import threading
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        sink = self.server.sink
+        self._reply("220 localhost SMTP sink ready")
+        in_data = False
+        size = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if in_data:
+                if line in (b".\r\n", b".\n"):
+                    in_data = False
+                    sink._delivered(size)
+                    self._reply("250 OK: queued")
+                else:
+                    size += len(line)
+                continue
+
+            command = line.strip().decode("ascii", "replace")
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                if verb == "EHLO":
+                    self.wfile.write(b"250-localhost\r\n250-AUTH PLAIN LOGIN\r\n250-8BITMIME\r\n")
+                self._reply("250 localhost")
+            elif verb == "AUTH":
+                parts = command.split()
+                mechanism = parts[1].upper() if len(parts) > 1 else ""
+                if mechanism == "LOGIN":
+                    if len(parts) < 3:
+                        self._reply("334 VXNlcm5hbWU6") # "Username:"
+                        self.rfile.readline()
+                    self._reply("334 UGFzc3dvcmQ6") # "Password:"
+                    self.rfile.readline()
+                elif len(parts) < 3:
+                    self._reply("334 ")
+                    self.rfile.readline()
+                self._reply(sink.replies.get("AUTH", "235 2.7.0 Authentication successful"))
+            elif verb in ("MAIL", "RCPT"):
+                self._reply(sink.replies.get(verb, "250 OK"))
+            elif verb in ("RSET", "NOOP"):
+                self._reply("250 OK")
+            elif verb == "DATA" and "DATA" in sink.replies:
+                self._reply(sink.replies["DATA"])
+            elif verb == "DATA":
+                in_data = True
+                size = 0
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """
+    Runs the sink on a background thread. Use port=0 to pick a free port. `replies` maps a
+    command (AUTH, MAIL, RCPT, DATA) to the reply line sent instead of the usual success.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, replies=None):
+        self._server = _Server((host, port), _SMTPHandler)
+        self._server.sink = self
+        self.host, self.port = self._server.server_address
+        self.replies = dict(replies or {})
+        self.messages = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _delivered(self, size):
+        with self._lock:
+            self.messages += 1
+            self.bytes += size
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="smtp-sink", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local SMTP sink that accepts and discards all mail.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    args = parser.parse_args()
+    sink = SMTPSink(args.host, args.port)
+    print(f"SMTP sink listening on {sink.host}:{sink.port} (Ctrl+C to stop)")
+    try:
+        sink._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink._server.server_close()
+        print(f"Accepted {sink.messages} messages ({sink.bytes} bytes).")
@@ -0,0 +1,281 @@
+# suppression.py
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from firebase_handler import field_filter, get_db, server_timestamp
+from log_writer import FIRESTORE_MAX_BATCH
+
+SUPPRESSION_CACHE_PATH = os.getenv("SUPPRESSION_CACHE_PATH", "suppression_cache.db")
+# Seconds between incremental syncs of a user's suppressions from Firestore
+SUPPRESSION_SYNC_INTERVAL = float(os.getenv("SUPPRESSION_SYNC_INTERVAL", "300"))
+# Above this many suppressed addresses a user's in-memory index is a Bloom filter instead of a hashed set
+SUPPRESSION_BLOOM_THRESHOLD = int(os.getenv("SUPPRESSION_BLOOM_THRESHOLD", "1000000"))
+SUPPRESSION_BLOOM_ERROR_RATE = float(os.getenv("SUPPRESSION_BLOOM_ERROR_RATE", "0.0001"))
+
+# Manual unsubscribes are stored here as {'userId', 'email', 'reason', 'createdAt', 'committedAt'}
+SUPPRESSIONS_COLLECTION = 'suppressions'
+
+BOUNCED, UNSUBSCRIBED = "bounced", "unsubscribed"
+REASON_LABELS = {BOUNCED: "suppressed: earlier hard bounce", UNSUBSCRIBED: "suppressed: unsubscribed"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS suppressed (
+    user_id TEXT,
+    email_hash BLOB,
+    reason TEXT,
+    PRIMARY KEY (user_id, email_hash)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    user_id TEXT,
+    source TEXT,
+    cursor TEXT,
+    PRIMARY KEY (user_id, source)
+);
+"""
+
+
+def email_hash(email):
+    """Addresses are kept only as 16-byte digests of the trimmed, lowercased address."""
+    return hashlib.blake2b(str(email).strip().lower().encode("utf-8"), digest_size=16).digest()
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over email digests; no false negatives, about `error_rate` false positives."""
+
+    def __init__(self, capacity, error_rate=SUPPRESSION_BLOOM_ERROR_RATE):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest):
+        # Double hashing from the two halves of the digest
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, digest, reason=None):
+        for position in self._positions(digest):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def get(self, digest):
+        """Returns a generic reason if the digest is (probably) present, else None. Bloom filters don't keep reasons."""
+        for position in self._positions(digest):
+            if not self._bits[position >> 3] & (1 << (position & 7)):
+                return None
+        return "suppressed"
+
+    def __len__(self):
+        return self.count
+
+
+class HashedSet:
+    """Exact index of email digests, with the reason each one was suppressed."""
+
+    def __init__(self):
+        self._reasons = {}
+
+    def add(self, digest, reason=None):
+        self._reasons.setdefault(digest, reason)
+
+    def get(self, digest):
+        return self._reasons.get(digest)
+
+    def __len__(self):
+        return len(self._reasons)
+
+
+class SuppressionList:
+    """
+    Per-user index of addresses that must not be mailed again: earlier hard bounces (emailLogs
+    entries flagged `bounce`, i.e. the recipient was refused at RCPT) and manual unsubscribes. The index is cached in a local
+    SQLite file and topped up incrementally from Firestore, using a per-user cursor on each
+    source's committedAt, at most every `sync_interval` seconds. committedAt is the server's
+    commit time rather than the send time, so log entries committed late (batched, replayed
+    from the spill file, or written by another instance) still land after the cursor.
+    """
+
+    def __init__(self, path=SUPPRESSION_CACHE_PATH, client=None, sync_interval=SUPPRESSION_SYNC_INTERVAL,
+                 bloom_threshold=SUPPRESSION_BLOOM_THRESHOLD):
+        self.path = path
+        self.client = client
+        self.sync_interval = sync_interval
+        self.bloom_threshold = bloom_threshold
+        self._conn = None
+        self._indexes = {} # user_id -> HashedSet or BloomFilter
+        self._synced_at = {} # user_id -> time.monotonic() of the last sync
+        self._lock = threading.RLock()
+
+    def _client(self):
+        return self.client if self.client is not None else get_db()
+
+    def _db(self):
+        # Opened on first use so importing this module stays cheap
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def _index(self, user_id):
+        """The user's in-memory index, loaded from the local cache on first use."""
+        index = self._indexes.get(user_id)
+        if index is None:
+            conn = self._db()
+            (count,) = conn.execute("SELECT COUNT(*) FROM suppressed WHERE user_id = ?", (user_id,)).fetchone()
+            index = BloomFilter(count * 2) if count >= self.bloom_threshold else HashedSet()
+            for digest, reason in conn.execute("SELECT email_hash, reason FROM suppressed WHERE user_id = ?", (user_id,)):
+                index.add(digest, reason)
+            self._indexes[user_id] = index
+        return index
+
+    def _store(self, user_id, entries):
+        """Adds (digest, reason) pairs to the local cache and the in-memory index. Returns how many were new."""
+        if not entries:
+            return 0
+        with self._lock:
+            conn = self._db()
+            index = self._index(user_id)
+            with conn:
+                before = conn.total_changes
+                conn.executemany("INSERT OR IGNORE INTO suppressed VALUES (?, ?, ?)",
+                                 [(user_id, digest, reason) for digest, reason in entries])
+                added = conn.total_changes - before
+            for digest, reason in entries:
+                index.add(digest, reason)
+            if isinstance(index, HashedSet) and len(index) >= self.bloom_threshold:
+                del self._indexes[user_id] # Rebuilt as a Bloom filter on next use
+        return added
+
+    def add(self, user_id, emails, reason=BOUNCED):
+        """Suppresses addresses locally, e.g. a hard bounce seen during the current campaign."""
+        return self._store(user_id, [(email_hash(email), reason) for email in emails])
+
+    def unsubscribe(self, user_id, emails):
+        """
+        Records manual unsubscribes in Firestore (so other instances pick them up) and locally.
+        Returns the number of addresses suppressed and no error, or 0 and an error message.
+        """
+        emails = sorted({str(email).strip().lower() for email in emails if str(email).strip()})
+        if not emails:
+            return 0, None
+        try:
+            client = self._client()
+            if client is None:
+                raise RuntimeError("Firestore client is not initialized.")
+            collection = client.collection(SUPPRESSIONS_COLLECTION)
+            now = datetime.now()
+            for start in range(0, len(emails), FIRESTORE_MAX_BATCH):
+                batch = client.batch()
+                for email in emails[start:start + FIRESTORE_MAX_BATCH]:
+                    # One document per user and address, so repeated unsubscribes don't pile up
+                    doc_id = f"{user_id}_{email_hash(email).hex()}"
+                    batch.set(collection.document(doc_id), {'userId': user_id, 'email': email,
+                                                           'reason': UNSUBSCRIBED, 'createdAt': now,
+                                                           'committedAt': server_timestamp()})
+                batch.commit()
+        except Exception as e:
+            return 0, f"Error saving unsubscribes: {e}"
+        self._store(user_id, [(email_hash(email), UNSUBSCRIBED) for email in emails])
+        return len(emails), None
+
+    def _cursor(self, user_id, source):
+        with self._lock:
+            row = self._db().execute("SELECT cursor FROM sync_state WHERE user_id = ? AND source = ?",
+                                     (user_id, source)).fetchone()
+        return datetime.fromisoformat(row[0]) if row and row[0] else None
+
+    def _save_cursor(self, user_id, source, value):
+        with self._lock, self._db() as conn:
+            conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)", (user_id, source, value.isoformat()))
+
+    def _pull(self, client, user_id, collection, time_field, extra_filters, to_entry):
+        """Reads a collection's documents for the user newer than the stored cursor. Returns how many addresses were new."""
+        query = client.collection(collection).where(filter=field_filter('userId', '==', user_id))
+        for field, op, value in extra_filters:
+            query = query.where(filter=field_filter(field, op, value))
+        cursor = self._cursor(user_id, collection)
+        if cursor is not None:
+            # >= so entries sharing the cursor's timestamp are not missed; re-adding them is a no-op
+            query = query.where(filter=field_filter(time_field, '>=', cursor))
+        entries = []
+        latest = cursor
+        for doc in query.order_by(time_field).stream():
+            data = doc.to_dict()
+            entry = to_entry(data)
+            if entry:
+                entries.append(entry)
+            if data.get(time_field) is not None:
+                latest = data[time_field]
+        added = self._store(user_id, entries)
+        if latest is not None and latest != cursor:
+            self._save_cursor(user_id, collection, latest)
+        return added
+
+    def sync(self, user_id, force=False):
+        """
+        Pulls new hard bounces and unsubscribes for the user from Firestore, unless the last sync
+        was less than `sync_interval` seconds ago. Returns (new entries, error).
+        """
+        with self._lock:
+            last = self._synced_at.get(user_id)
+            if not force and last is not None and time.monotonic() - last < self.sync_interval:
+                return 0, None
+            self._synced_at[user_id] = time.monotonic()
+        try:
+            client = self._client()
+            if client is None:
+                raise RuntimeError("Firestore client is not initialized.")
+            bounces = self._pull(
+                client, user_id, "emailLogs", "committedAt", [('bounce', '==', True)],
+                lambda d: (email_hash(d['email']), BOUNCED) if d.get('email') else None,
+            )
+            unsubscribes = self._pull(
+                client, user_id, SUPPRESSIONS_COLLECTION, "committedAt", [],
+                lambda d: (email_hash(d['email']), d.get('reason') or UNSUBSCRIBED) if d.get('email') else None,
+            )
+            return bounces + unsubscribes, None
+        except Exception as e:
+            with self._lock:
+                self._synced_at.pop(user_id, None) # Try again on the next job
+            return 0, f"Error syncing suppressions: {e}"
+
+    def filter_recipients(self, user_id, recipients):
+        """
+        Splits recipient dicts into (kept, suppressed), where suppressed are reject dicts
+        {'row', 'name', 'email', 'reason'} like the ones from excel ingestion.
+        """
+        with self._lock:
+            index = self._index(user_id)
+        if not len(index):
+            return recipients, []
+        kept, suppressed = [], []
+        lookup = index.get
+        for recipient in recipients:
+            reason = lookup(email_hash(recipient['email']))
+            if reason is None:
+                kept.append(recipient)
+            else:
+                suppressed.append({'row': recipient['row'], 'name': recipient['name'], 'email': recipient['email'],
+                                   'reason': REASON_LABELS.get(reason, reason)})
+        return kept, suppressed
+
+    def count(self, user_id):
+        with self._lock:
+            return len(self._index(user_id))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+# Instantiate the SuppressionList
+suppression_list = SuppressionList()
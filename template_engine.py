@@ -0,0 +1,136 @@
+# template_engine.py
+import html
+import re
+
+# {Column} or {Column|default}. Use {{ and }} for literal braces. Column names cannot contain
+# ':', ';' or line breaks, so CSS rules such as {color:red} in an HTML body are kept as written.
+PLACEHOLDER_PATTERN = re.compile(r"\{\{|\}\}|\{([^{}|:;\n]+)(?:\|([^{}\n]*))?\}")
+
+
+def format_value(value):
+    """Text for a spreadsheet value. Whole-number floats (12345.0, e.g. from a numeric column with blanks) lose the '.0'."""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class CompiledTemplate:
+    """
+    A subject or body template parsed once into literal text and placeholders.
+    Placeholders name spreadsheet columns, e.g. {Name} or {Company|your company}; the text after
+    `|` is used when the recipient's value is empty. `escape`, if given, is applied to every
+    recipient value (e.g. html.escape for HTML bodies); literal text and defaults are used as written.
+    """
+
+    def __init__(self, text, escape=None):
+        self.text = text or ""
+        self.escape = escape
+        self.parts = [] # ("text", literal, None) or ("field", column, default)
+        literal = []
+        pos = 0
+        for match in PLACEHOLDER_PATTERN.finditer(self.text):
+            literal.append(self.text[pos:match.start()])
+            pos = match.end()
+            token = match.group(0)
+            if token in ("{{", "}}"):
+                literal.append(token[0])
+                continue
+            if literal:
+                self.parts.append(("text", "".join(literal), None))
+                literal = []
+            self.parts.append(("field", match.group(1).strip(), match.group(2)))
+        literal.append(self.text[pos:])
+        if "".join(literal):
+            self.parts.append(("text", "".join(literal), None))
+
+    @property
+    def placeholders(self):
+        return [(column, default) for kind, column, default in self.parts if kind == "field"]
+
+    def render_batch(self, frame):
+        """Renders the template for every row of a DataFrame of recipient fields in one pass."""
+        import pandas as pd
+        rendered = pd.Series("", index=frame.index, dtype=object)
+        for kind, value, default in self.parts:
+            if kind == "text":
+                rendered = rendered + value
+                continue
+            column = frame[value]
+            as_text = column.map(format_value)
+            missing = column.isna() | (as_text.str.strip() == "")
+            if self.escape:
+                as_text = as_text.map(self.escape)
+            rendered = rendered + as_text.where(~missing, default or "")
+        return rendered.tolist()
+
+
+class CampaignTemplates:
+    """The compiled subject, plain-text body and optional HTML body templates for one sending job."""
+
+    def __init__(self, subject, body, html_body=None):
+        self.subject = CompiledTemplate(subject)
+        self.body = CompiledTemplate(body)
+        # Recipient values are HTML-escaped in the HTML body; the template's own markup is kept
+        self.html_body = CompiledTemplate(html_body, escape=html.escape) if html_body and html_body.strip() else None
+
+    @property
+    def has_html(self):
+        return self.html_body is not None
+
+    def _templates(self):
+        return [t for t in (self.subject, self.body, self.html_body) if t is not None]
+
+    def columns(self):
+        return sorted({column for template in self._templates() for column, _ in template.placeholders})
+
+    def render_batch(self, frame):
+        """
+        Renders subject, body and HTML body for each row of a DataFrame of recipient fields
+        (object columns, as from excel_handler.read_recipients). Returns a list of (subject, body,
+        html_body) tuples in row order; html_body is None when the job has no HTML template.
+        """
+        if frame.empty:
+            return []
+        html_bodies = self.html_body.render_batch(frame) if self.has_html else [None] * len(frame)
+        return list(zip(self.subject.render_batch(frame), self.body.render_batch(frame), html_bodies))
+
+    def iter_rendered(self, recipients, fields, batch_size=500):
+        """
+        Lazily yields (recipient, subject, body, html_body), rendering `batch_size` recipients at a
+        time from their rows of `fields` (a DataFrame indexed by the recipients' 'row').
+        """
+        batch = []
+        for recipient in recipients:
+            batch.append(recipient)
+            if len(batch) >= batch_size:
+                yield from self._render_rows(batch, fields)
+                batch = []
+        if batch:
+            yield from self._render_rows(batch, fields)
+
+    def _render_rows(self, batch, fields):
+        frame = fields.loc[[recipient['row'] for recipient in batch]]
+        return ((recipient,) + rendered for recipient, rendered in zip(batch, self.render_batch(frame)))
+
+
+class TemplateEngine:
+    def compile_templates(self, subject_template, body_template, columns, html_template=None):
+        """
+        Parses the subject, body and (optional) HTML body templates once for a job and checks every
+        placeholder against the uploaded file's columns.
+        Returns the CampaignTemplates and no error, or None and an error message.
+        """
+        try:
+            templates = CampaignTemplates(subject_template, body_template, html_template)
+            unknown = [column for column in templates.columns() if column not in set(columns)]
+            if unknown:
+                raise ValueError(
+                    f"Unknown placeholder(s) {', '.join('{' + c + '}' for c in unknown)}. "
+                    f"Available columns: {', '.join(str(c) for c in columns)}"
+                )
+            return templates, None
+        except Exception as e:
+            return None, f"Error in email template: {e}"
+
+# Instantiate the TemplateEngine
+template_manager = TemplateEngine()
@@ -0,0 +1,17 @@
+# conftest.py
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+# The modules live at the repository root rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Module-level singletons (job journal, suppression cache, results) open their files on import;
+# keep them out of the working tree
+_scratch = tempfile.mkdtemp(prefix="email-tool-tests-")
+atexit.register(shutil.rmtree, _scratch, True)
+for name, filename in (("JOB_JOURNAL_PATH", "job_journal.db"), ("SUPPRESSION_CACHE_PATH", "suppression_cache.db"),
+                       ("RESULTS_DIR", "results"), ("LOG_SPILL_PATH", "failed_email_logs.jsonl")):
+    os.environ.setdefault(name, os.path.join(_scratch, filename))
@@ -0,0 +1,60 @@
+# test_auth_handler.py
+import pytest
+
+from auth_handler import AuthHandler
+from fake_auth import InMemoryAuth
+from fake_firestore import FakeDocumentReference, InMemoryFirestore
+
+
+@pytest.fixture
+def handler():
+    auth, db = InMemoryAuth(), InMemoryFirestore()
+    auth.create_user("ada@example.com", display_name="Ada")
+    handler = AuthHandler(auth=auth, db=db, cache_ttl=60)
+    yield handler
+    handler.flush()
+
+
+def profile(handler, uid):
+    handler.flush() # Wait for the background profile write
+    return handler.db.collection('users').document(uid).get().to_dict()
+
+
+def test_login_creates_profile_once(handler):
+    uid, email, error = handler.login_user("ada@example.com", "secret")
+    assert (email, error) == ("ada@example.com", None)
+    first = profile(handler, uid)
+    assert first['displayName'] == "Ada"
+    assert first['createdAt'] == first['lastLogin']
+
+    handler.db.collection('users').document(uid).update({'displayName': "Ada L."})
+    handler.login_user("ada@example.com", "secret")
+    second = profile(handler, uid)
+    assert second['createdAt'] == first['createdAt']
+    assert second['displayName'] == "Ada L."
+    assert second['lastLogin'] > first['lastLogin']
+
+
+def test_user_lookups_are_cached(handler):
+    handler.login_user("ada@example.com", "secret")
+    handler.login_user("ADA@example.com ", "secret")
+    assert handler.auth.lookups == 1
+
+
+def test_unknown_user_is_refused(handler):
+    uid, email, error = handler.login_user("nobody@example.com", "secret")
+    assert (uid, email) == (None, None)
+    assert "nobody@example.com" in error
+
+
+def test_failed_update_does_not_recreate_the_profile(handler, capsys, monkeypatch):
+    uid, _, _ = handler.login_user("ada@example.com", "secret")
+    first = profile(handler, uid)
+
+    def timeout(self, data):
+        raise TimeoutError("Deadline exceeded")
+
+    monkeypatch.setattr(FakeDocumentReference, "update", timeout)
+    handler.login_user("ada@example.com", "secret")
+    assert profile(handler, uid) == first
+    assert "Error updating user profile" in capsys.readouterr().out
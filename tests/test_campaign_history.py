@@ -0,0 +1,57 @@
+# test_campaign_history.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from campaign_history import CampaignHistory, parse_date_range
+from fake_firestore import InMemoryFirestore
+
+START = datetime(2024, 5, 1, 9, 0)
+
+
+@pytest.fixture
+def firestore():
+    firestore = InMemoryFirestore()
+    logs = firestore.collection('emailLogs')
+    for i in range(7):
+        logs.add({'userId': 'user', 'jobId': 'job1' if i < 5 else 'job2', 'email': f"r{i}@example.com",
+                  'status': 'failed' if i % 3 == 0 else 'sent', 'timestamp': START + timedelta(hours=i)})
+    logs.add({'userId': 'other', 'jobId': 'job9', 'email': "x@example.com", 'status': 'sent', 'timestamp': START})
+    # Two entries with the same timestamp must not be lost or repeated at a page boundary
+    logs.add({'userId': 'user', 'jobId': 'job2', 'email': "same@example.com", 'status': 'sent', 'timestamp': START + timedelta(hours=6)})
+    return firestore
+
+
+def test_pages_cover_every_entry_once_newest_first(firestore):
+    history = CampaignHistory(client=firestore, page_size=3)
+    seen, cursor = [], None
+    while True:
+        entries, cursor, error = history.page('user', cursor=cursor)
+        assert error is None
+        seen.extend(entries)
+        if cursor is None:
+            break
+    assert len(seen) == 8
+    assert len({entry['email'] for entry in seen}) == 8
+    timestamps = [entry['timestamp'] for entry in seen]
+    assert timestamps == sorted(timestamps, reverse=True)
+
+
+def test_filters_by_status_and_date_range(firestore):
+    start, end = parse_date_range("2024-05-01", "2024-05-01")
+    entries, cursor, error = CampaignHistory(client=firestore).page('user', start=start, end=end, status='failed')
+    assert error is None and cursor is None
+    assert [entry['email'] for entry in entries] == ["r6@example.com", "r3@example.com", "r0@example.com"]
+    with pytest.raises(ValueError):
+        parse_date_range("2024-13-01", "")
+
+
+def test_campaign_totals_are_cached(firestore):
+    history = CampaignHistory(client=firestore, totals_ttl=60)
+    totals, error = history.campaign_totals('user', ['job1', 'job2'])
+    assert error is None
+    assert totals == {'job1': {'sent': 3, 'failed': 2}, 'job2': {'sent': 2, 'failed': 1}}
+
+    firestore.collection('emailLogs').add({'userId': 'user', 'jobId': 'job1', 'status': 'sent', 'timestamp': START})
+    assert history.campaign_totals('user', ['job1'])[0] == {'job1': {'sent': 3, 'failed': 2}}
+    assert CampaignHistory(client=firestore).campaign_totals('user', ['job1'])[0] == {'job1': {'sent': 4, 'failed': 2}}
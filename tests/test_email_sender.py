@@ -0,0 +1,46 @@
+# test_email_sender.py
+import smtplib
+
+import pytest
+
+from email_sender import EmailSender, classify_smtp_error
+from smtp_sink import SMTPSink
+
+
+@pytest.mark.parametrize("error, expected", [
+    # A failed login or a refused sender says nothing about the recipient
+    (smtplib.SMTPAuthenticationError(535, b"5.7.8 Username and Password not accepted"), (535, False, False)),
+    (smtplib.SMTPSenderRefused(550, b"5.4.5 Daily user sending quota exceeded", "me@example.com"), (550, False, False)),
+    (smtplib.SMTPSenderRefused(421, b"4.7.0 Try again later", "me@example.com"), (421, True, False)),
+    # Only a permanent refusal of the recipient at RCPT is a bounce
+    (smtplib.SMTPRecipientsRefused({"to@example.com": (550, b"5.1.1 No such user")}), (550, False, True)),
+    (smtplib.SMTPRecipientsRefused({"to@example.com": (450, b"4.2.1 Mailbox busy")}), (450, True, False)),
+    (smtplib.SMTPDataError(554, b"5.7.1 Message rejected"), (554, False, False)),
+    (smtplib.SMTPServerDisconnected("Connection unexpectedly closed"), (None, True, False)),
+    (ConnectionRefusedError(111, "Connection refused"), (None, True, False)),
+    (ValueError("not an SMTP error"), (None, False, False)),
+])
+def test_classify_smtp_error(error, expected):
+    assert classify_smtp_error(error, "to@example.com") == expected
+
+
+def test_classify_picks_the_given_recipient():
+    error = smtplib.SMTPRecipientsRefused({"a@example.com": (450, b"busy"), "b@example.com": (550, b"unknown")})
+    assert classify_smtp_error(error, "b@example.com") == (550, False, True)
+
+
+@pytest.mark.parametrize("replies, expected", [
+    ({}, (True, 250, False, False)),
+    ({"AUTH": "535 5.7.8 Username and Password not accepted"}, (False, 535, False, False)),
+    ({"MAIL": "550 5.4.5 Daily user sending quota exceeded"}, (False, 550, False, False)),
+    ({"RCPT": "550 5.1.1 No such user"}, (False, 550, False, True)),
+    ({"RCPT": "451 4.3.0 Try again later"}, (False, 451, True, False)),
+])
+def test_deliver_against_sink(replies, expected):
+    with SMTPSink(replies=replies) as sink:
+        sender = EmailSender(host=sink.host, port=sink.port, use_ssl=False, starttls=False, timeout=5)
+        success, message, code, transient, bounce = sender.deliver(
+            "me@example.com", "app-password", "to@example.com", "Hello", "Hi there")
+        sender.pool.close_all()
+    assert (success, code, transient, bounce) == expected, message
+    assert sink.messages == (1 if success else 0)
@@ -0,0 +1,85 @@
+# test_excel_handler.py
+from datetime import datetime
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from excel_handler import RecipientStream, ResultsWriter, excel_manager
+
+
+def read_report(output):
+    rows = list(load_workbook(output, read_only=True).active.iter_rows(values_only=True))
+    return [dict(zip(rows[0], row)) for row in rows[1:]]
+
+
+def test_recorded_outcome_wins_over_a_suppressed_reject():
+    # A resumed job: B bounced in the first run and is now also reported as suppressed
+    initial_df = pd.DataFrame({'Name': ['A', 'C'], 'Email': ['a@y.com', 'c@y.com']}, index=pd.Index([0, 2], name='row'))
+    log_data = [
+        {'row': 0, 'status': 'sent', 'error': '', 'timestamp': '2024-05-01T10:00:00'},
+        {'row': 1, 'status': 'failed', 'error': '550 no such user', 'timestamp': '2024-05-01T10:00:01', 'code': '550'},
+        {'row': 2, 'status': 'deferred', 'error': '421 try later', 'timestamp': '2024-05-01T10:00:02'},
+        {'row': 2, 'status': 'sent', 'error': '', 'timestamp': '2024-05-02T09:00:00', 'attempts': '2'}, # Resumed
+    ]
+    rejects = [
+        {'row': 1, 'name': 'B', 'email': 'b@y.com', 'reason': 'suppressed: earlier hard bounce'},
+        {'row': 3, 'name': 'D', 'email': 'not-an-email', 'reason': 'invalid email'},
+    ]
+
+    output, error = excel_manager.generate_final_excel(initial_df, log_data, rejects)
+
+    assert error is None
+    assert [(r['Name'], r['Status'], r['Error Details']) for r in read_report(output)] == [
+        ('A', '✅ Sent', None),
+        ('B', '❌ Failed', '550 no such user'),
+        ('C', '✅ Sent', None),
+        ('D', '⚠️ Skipped', 'invalid email'),
+    ]
+
+
+def test_stream_rejects_duplicates_across_batches():
+    rows = [("A", " A@Example.com"), ("B", "b@example.com"), ("", ""), ("C", "a@example.com"),
+            ("D", "not-an-email"), ("E", "B@EXAMPLE.COM"), ("F", "f@example.com")]
+    stream = RecipientStream(["Name", "Email"], iter(rows), batch_size=2)
+
+    recipients = list(stream)
+
+    assert [(r['row'], r['email']) for r in recipients] == [(0, "a@example.com"), (1, "b@example.com"), (6, "f@example.com")]
+    assert [(r['row'], r['reason']) for r in stream.rejects] == [(3, "duplicate email"), (4, "invalid email"), (5, "duplicate email")]
+
+
+def test_read_recipients_keeps_only_the_template_columns():
+    csv_bytes = b"Name,Email,Zip,Notes\nAda,ada@example.com,12345,long text\nBob,bob@example.com,,more text\n"
+    stream, error = excel_manager.open_recipient_stream(csv_bytes, "list.csv")
+    assert error is None
+
+    frame, recipients, rejects, error = excel_manager.read_recipients(stream, fields=["Zip"])
+
+    assert error is None and rejects == []
+    assert recipients == [{'row': 0, 'name': "Ada", 'email': "ada@example.com"},
+                          {'row': 1, 'name': "Bob", 'email': "bob@example.com"}]
+    assert list(frame.columns) == ["Name", "Email", "Zip"]
+    assert frame.loc[0, "Zip"] == "12345"
+
+
+def test_results_writer_report_uses_latest_outcome(tmp_path):
+    writer = ResultsWriter("job", directory=str(tmp_path))
+    writer.record(0, "A", "a@y.com", "deferred", "421 try later", datetime(2024, 5, 1, 10, 0), attempts=1, code=421)
+    writer.close()
+    # A resumed job appends to the same sidecar
+    writer = ResultsWriter("job", directory=str(tmp_path))
+    writer.record(0, "A", "a@y.com", "sent", None, datetime(2024, 5, 2, 9, 0), attempts=2, code=250)
+    writer.record(1, "B", "b@y.com", "failed", "550 no such user", datetime(2024, 5, 2, 9, 1), attempts=1, code=550)
+    initial_df = pd.DataFrame({'Name': ['A', 'B', 'C'], 'Email': ['a@y.com', 'b@y.com', 'c@y.com']},
+                              index=pd.Index([0, 1, 2], name='row'))
+
+    path, error = writer.write_final_report(initial_df)
+    writer.close()
+
+    assert error is None
+    assert [(r['Name'], r['Status'], r['Sent Timestamp'], r['Attempts'], r['Last Response Code'])
+            for r in read_report(path)] == [
+        ('A', '✅ Sent', '2024-05-02 09:00:00', '2', '250'),
+        ('B', '❌ Failed', '2024-05-02 09:01:00', '1', '550'),
+        ('C', 'Not Sent', None, None, None),
+    ]
@@ -0,0 +1,60 @@
+# test_job_journal.py
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from job_journal import DEFERRED, FAILED, SENT, JobJournal
+from send_scheduler import SendScheduler
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = JobJournal(str(tmp_path / "journal.db"))
+    yield journal
+    journal.close()
+
+
+@pytest.mark.parametrize("backend", ["thread", "asyncio"])
+def test_stopped_job_leaves_waiting_retries_pending(journal, backend):
+    # Journals outcomes the way app.py does: final results as sent/failed, waiting retries as deferred
+    journal.create_job("job", "user", "me@example.com", "Hi", "Body", "list.xlsx", 6)
+    stop = threading.Event()
+
+    def send(row):
+        if row == 1:
+            return False, 421
+        if row == 3:
+            return False, 550
+        if row == 4:
+            stop.set()
+        return True, 250
+
+    def on_result(row, item, result):
+        journal.record("job", row, SENT if result[0] else FAILED, sender="me@example.com", response_code=result[1])
+
+    def on_deferred(row, item, result):
+        journal.record("job", row, DEFERRED, sender="me@example.com", attempts=1, response_code=result[1])
+
+    scheduler = SendScheduler(workers=1, rate=1000, burst=1000, backend=backend)
+    dispatched = scheduler.run(range(6), send, on_result=on_result, should_stop=stop.is_set,
+                               retry_delay=lambda row, result, tries: 60 if result[1] == 421 else None,
+                               on_deferred=on_deferred)
+
+    assert dispatched == 5
+    # Row 1 was waiting for a retry: not completed, so a resume sends it again; row 5 was never sent
+    assert journal.completed_rows("job") == {0, 2, 3, 4}
+    assert journal.sender_usage(datetime.now() - timedelta(minutes=1)) == {"me@example.com": (3, 1)}
+
+
+def test_new_job_is_queued_and_resumable_until_completed(journal):
+    # A job stopped before it started stays "queued", never "running", and can still be resumed
+    journal.create_job("job", "user", "me@example.com", "Hi", "Body", "list.xlsx", 2)
+    assert journal.get_job("job")["status"] == "queued"
+    assert [job["job_id"] for job in journal.resumable_jobs("user")] == ["job"]
+
+    journal.set_job_status("job", "running")
+    journal.record("job", 0, SENT)
+    journal.record("job", 1, FAILED)
+    journal.set_job_status("job", "completed")
+    assert journal.resumable_jobs("user") == []
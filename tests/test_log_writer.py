@@ -0,0 +1,54 @@
+# test_log_writer.py
+from datetime import datetime
+
+from fake_firestore import InMemoryFirestore
+from log_writer import FirestoreLogWriter
+
+
+def spilled_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [line for line in f if line.strip()]
+
+
+def test_failed_commits_are_spilled_and_replayed(tmp_path):
+    firestore = InMemoryFirestore()
+    firestore.fail_commits = True
+    spill_path = str(tmp_path / "spill.jsonl")
+    writer = FirestoreLogWriter(client=firestore, batch_size=2, flush_interval=60, spill_path=spill_path).start()
+    for i in range(3):
+        writer.add({'userId': 'user', 'row': i, 'timestamp': datetime(2024, 5, 1, 10, i)})
+    writer.close()
+    assert writer.spilled == 3 and len(spilled_lines(spill_path)) == 3
+
+    # Still failing: nothing is lost
+    assert writer.replay_spilled() == 0
+    assert len(spilled_lines(spill_path)) == 3
+
+    firestore.fail_commits = False
+    assert writer.replay_spilled() == 3
+    assert spilled_lines(spill_path) == []
+    logs = [doc.to_dict() for doc in firestore.collection('emailLogs').stream()]
+    assert sorted(log['row'] for log in logs) == [0, 1, 2]
+    assert all(isinstance(log['timestamp'], datetime) and isinstance(log['committedAt'], datetime) for log in logs)
+
+
+def test_entries_spilled_during_a_replay_are_kept(tmp_path):
+    spill_path = str(tmp_path / "spill.jsonl")
+    failing = InMemoryFirestore()
+    failing.fail_commits = True
+    FirestoreLogWriter(client=failing, spill_path=spill_path)._commit([{'row': 0}])
+
+    firestore = InMemoryFirestore()
+    other_job = FirestoreLogWriter(client=failing, spill_path=spill_path)
+    make_batch = firestore.batch
+
+    def batch():
+        # Another job spills while this replay's commit is in flight
+        batch = make_batch()
+        commit = batch.commit
+        batch.commit = lambda: (commit(), other_job._commit([{'row': 1}]))
+        return batch
+
+    firestore.batch = batch
+    assert FirestoreLogWriter(client=firestore, spill_path=spill_path).replay_spilled() == 1
+    assert ['"row": 1' in line for line in spilled_lines(spill_path)] == [True]
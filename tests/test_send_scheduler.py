@@ -0,0 +1,121 @@
+# test_send_scheduler.py
+import threading
+import time
+
+import pytest
+
+from send_scheduler import RetryPolicy, SendScheduler
+
+BACKENDS = ["thread", "asyncio"]
+
+
+def make_scheduler(backend, workers=4):
+    return SendScheduler(workers=workers, rate=1000, burst=1000, backend=backend)
+
+
+class Recorder:
+    """Collects on_result / on_deferred calls, as (index, item, result) tuples."""
+
+    def __init__(self):
+        self.results = []
+        self.deferred = []
+        self._lock = threading.Lock()
+
+    def on_result(self, index, item, result):
+        with self._lock:
+            self.results.append((index, item, result))
+
+    def on_deferred(self, index, item, result):
+        with self._lock:
+            self.deferred.append((index, item, result))
+
+
+def test_retry_policy_gives_up_after_max_attempts():
+    policy = RetryPolicy(max_attempts=3, base_delay=10, max_delay=15)
+    assert 5 <= policy.delay_for(1) <= 10
+    assert 7.5 <= policy.delay_for(2) <= 15 # 20s capped at the max
+    assert policy.delay_for(3) is None
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_results_are_reported_in_item_order(backend):
+    items = list(range(20))
+
+    def send(item):
+        time.sleep(0.001 * (len(items) - item)) # Later items finish first
+        return item * 10
+
+    recorder = Recorder()
+    dispatched = make_scheduler(backend).run(items, send, on_result=recorder.on_result)
+    assert dispatched == len(items)
+    assert recorder.results == [(i, i, i * 10) for i in items]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_retried_items_are_reported_exactly_once(backend):
+    attempts = {}
+    lock = threading.Lock()
+
+    def send(item):
+        with lock:
+            attempts[item] = attempts.get(item, 0) + 1
+            count = attempts[item]
+        if item == "flaky":
+            return ("sent", count) if count == 3 else ("busy", count)
+        if item == "down":
+            return ("busy", count)
+        return ("sent", count)
+
+    def retry_delay(item, result, tries):
+        return 0.01 if result[0] == "busy" and tries < 4 else None
+
+    recorder = Recorder()
+    items = ["a", "flaky", "b", "down", "c"]
+    make_scheduler(backend).run(items, send, on_result=recorder.on_result, retry_delay=retry_delay,
+                                on_deferred=recorder.on_deferred)
+
+    assert sorted(index for index, _, _ in recorder.results) == [0, 1, 2, 3, 4]
+    reported = {item: result for _, item, result in recorder.results}
+    assert reported == {"a": ("sent", 1), "b": ("sent", 1), "c": ("sent", 1),
+                        "flaky": ("sent", 3), "down": ("busy", 4)}
+    assert attempts == {"a": 1, "b": 1, "c": 1, "flaky": 3, "down": 4}
+    assert recorder.deferred == []
+    # Items without retries keep their relative order
+    assert [item for _, item, _ in recorder.results if item in "abc"] == ["a", "b", "c"]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_stop_reports_waiting_retries_as_deferred(backend):
+    stop = threading.Event()
+
+    def send(item):
+        if item == 2:
+            stop.set() # Stop once the retry is scheduled; its backoff outlasts the run
+            return "busy"
+        return "sent"
+
+    def retry_delay(item, result, tries):
+        return 60 if result == "busy" else None
+
+    recorder = Recorder()
+    dispatched = make_scheduler(backend, workers=1).run(
+        range(10), send, on_result=recorder.on_result, should_stop=stop.is_set,
+        retry_delay=retry_delay, on_deferred=recorder.on_deferred,
+    )
+
+    assert recorder.deferred == [(2, 2, "busy")]
+    reported = [index for index, _, _ in recorder.results]
+    assert 2 not in reported
+    assert reported == sorted(reported)
+    # Every dispatched item is reported exactly once, through one of the two callbacks
+    assert len(reported) + len(recorder.deferred) == dispatched
+    assert dispatched < 10
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_stop_before_start_sends_nothing(backend):
+    recorder = Recorder()
+    dispatched = make_scheduler(backend).run(range(5), lambda item: "sent", on_result=recorder.on_result,
+                                             should_stop=lambda: True, on_deferred=recorder.on_deferred)
+    assert dispatched == 0
+    assert recorder.results == recorder.deferred == []
@@ -0,0 +1,66 @@
+# test_sender_pool.py
+import threading
+from collections import Counter
+
+from sender_pool import SenderAccount, SenderPool, interleave_domains
+
+
+def recipients(count, domains=("a.com",)):
+    return [{'row': i, 'name': f"R{i}", 'email': f"r{i}@{domains[i % len(domains)]}"} for i in range(count)]
+
+
+def make_pool(*accounts):
+    return SenderPool(list(accounts), usage=lambda since: {})
+
+
+def test_plan_splits_by_rate_within_quota():
+    fast = SenderAccount("fast@x.com", "pw", rate=2, daily_quota=100)
+    slow = SenderAccount("slow@x.com", "pw", rate=1, daily_quota=5)
+    pool = make_pool(fast, slow)
+
+    plan, over_quota = pool.plan(recipients(30), pool.accounts_for())
+
+    assert over_quota == 0
+    assert Counter(account.email for _, account in plan) == {"fast@x.com": 25, "slow@x.com": 5}
+    assert (fast.reserved, slow.reserved) == (25, 5)
+    assert slow.headroom == 0
+
+
+def test_concurrent_plans_never_share_headroom():
+    account = SenderAccount("a@x.com", "pw", daily_quota=30)
+    pool = make_pool(account)
+    plans = []
+    barrier = threading.Barrier(4)
+
+    def plan_job():
+        barrier.wait()
+        plans.append(pool.plan(recipients(20), [account]))
+
+    threads = [threading.Thread(target=plan_job) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(len(plan) for plan, _ in plans) == 30
+    assert sum(over for _, over in plans) == 4 * 20 - 30
+    assert account.reserved == 30
+
+
+def test_record_and_release_return_unused_reservations():
+    account = SenderAccount("a@x.com", "pw", daily_quota=10)
+    pool = make_pool(account)
+    plan, _ = pool.plan(recipients(8), [account])
+    for _ in range(3): # A job stopped after three sends
+        pool.record(account, success=True)
+    pool.record(account, success=False)
+    pool.release(account, len(plan) - 4)
+
+    assert account.reserved == 0
+    assert (account.sent_today, account.failed_today) == (3, 1)
+    assert account.headroom == 6
+
+
+def test_domains_are_interleaved():
+    ordered = interleave_domains(recipients(6, domains=("a.com", "a.com", "a.com", "a.com", "b.com", "b.com")))
+    assert [r['email'].split('@')[1] for r in ordered] == ["a.com", "b.com", "a.com", "a.com", "b.com", "a.com"]
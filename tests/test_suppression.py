@@ -0,0 +1,64 @@
+# test_suppression.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from fake_firestore import InMemoryFirestore
+from log_writer import FirestoreLogWriter
+from suppression import BOUNCED, REASON_LABELS, UNSUBSCRIBED, SuppressionList
+
+
+@pytest.fixture
+def firestore():
+    return InMemoryFirestore()
+
+
+@pytest.fixture
+def suppressions(tmp_path, firestore):
+    suppressions = SuppressionList(str(tmp_path / "suppressions.db"), client=firestore, sync_interval=0)
+    yield suppressions
+    suppressions.close()
+
+
+def log(firestore, tmp_path, **entry):
+    writer = FirestoreLogWriter(client=firestore, spill_path=str(tmp_path / "spill.jsonl"))
+    writer._commit([dict({'userId': 'user', 'timestamp': datetime.now()}, **entry)])
+
+
+def emails(recipients):
+    return [recipient['email'] for recipient in recipients]
+
+
+def test_only_recipient_bounces_are_suppressed(tmp_path, firestore, suppressions):
+    log(firestore, tmp_path, email='gone@example.com', status='failed', responseCode=550, bounce=True)
+    log(firestore, tmp_path, email='quota@example.com', status='failed', responseCode=550, bounce=False)
+    log(firestore, tmp_path, email='ok@example.com', status='sent', bounce=False)
+
+    assert suppressions.sync('user', force=True) == (1, None)
+    kept, suppressed = suppressions.filter_recipients('user', [
+        {'row': 2, 'name': 'A', 'email': 'gone@example.com'},
+        {'row': 3, 'name': 'B', 'email': 'quota@example.com'},
+    ])
+    assert emails(kept) == ['quota@example.com']
+    assert [(s['email'], s['reason']) for s in suppressed] == [('gone@example.com', REASON_LABELS[BOUNCED])]
+
+
+def test_bounce_committed_after_the_cursor_is_synced(tmp_path, firestore, suppressions):
+    log(firestore, tmp_path, email='first@example.com', bounce=True)
+    assert suppressions.sync('user', force=True) == (1, None)
+    # Sent an hour ago but only committed now, e.g. replayed from the spill file
+    log(firestore, tmp_path, email='late@example.com', bounce=True, timestamp=datetime.now() - timedelta(hours=1))
+    assert suppressions.sync('user', force=True) == (1, None)
+    _, suppressed = suppressions.filter_recipients('user', [{'row': 2, 'name': 'L', 'email': 'late@example.com'}])
+    assert emails(suppressed) == ['late@example.com']
+
+
+def test_unsubscribes_sync_to_other_caches(tmp_path, firestore, suppressions):
+    assert suppressions.unsubscribe('user', ['leave@example.com']) == (1, None)
+    other = SuppressionList(str(tmp_path / "other.db"), client=firestore, sync_interval=0)
+    try:
+        assert other.sync('user', force=True) == (1, None)
+        _, suppressed = other.filter_recipients('user', [{'row': 2, 'name': 'L', 'email': 'leave@example.com'}])
+        assert [s['reason'] for s in suppressed] == [REASON_LABELS[UNSUBSCRIBED]]
+    finally:
+        other.close()
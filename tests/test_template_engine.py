@@ -0,0 +1,40 @@
+# test_template_engine.py
+import pandas as pd
+
+from template_engine import CampaignTemplates, CompiledTemplate, template_manager
+
+
+def fields_frame(**columns):
+    return pd.DataFrame({name: pd.Series(values, dtype=object) for name, values in columns.items()})
+
+
+def test_defaults_fill_empty_values():
+    template = CompiledTemplate("Hi {Name}, welcome to {Company|our team}!")
+    frame = fields_frame(Name=["Ada", "Bob", "Cy"], Company=["Acme", None, "  "])
+    assert template.render_batch(frame) == ["Hi Ada, welcome to Acme!", "Hi Bob, welcome to our team!",
+                                            "Hi Cy, welcome to our team!"]
+
+
+def test_literal_braces_and_css_are_kept():
+    template = CompiledTemplate("<style>p {color:red}</style>{{Name}} is {Name}")
+    assert template.placeholders == [("Name", None)]
+    assert template.render_batch(fields_frame(Name=["Ada"])) == ["<style>p {color:red}</style>{Name} is Ada"]
+
+
+def test_whole_number_floats_lose_the_trailing_zero():
+    template = CompiledTemplate("{Zip}")
+    assert template.render_batch(fields_frame(Zip=[12345.0, 12345, "00501", 2.5])) == ["12345", "12345", "00501", "2.5"]
+
+
+def test_html_body_escapes_recipient_values_only():
+    templates = CampaignTemplates("Hi {Name}", "Hi {Name}", "<p>Hi <b>{Name}</b>, {Note|<i>welcome</i>}</p>")
+    frame = fields_frame(Name=["<Ada & Co>"], Note=[None])
+    assert templates.render_batch(frame) == [(
+        "Hi <Ada & Co>", "Hi <Ada & Co>", "<p>Hi <b>&lt;Ada &amp; Co&gt;</b>, <i>welcome</i></p>",
+    )]
+
+
+def test_unknown_placeholders_are_reported():
+    templates, error = template_manager.compile_templates("Hi {Name}", "From {Compnay}", ["Name", "Email", "Company"])
+    assert templates is None
+    assert "{Compnay}" in error